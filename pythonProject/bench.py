@@ -0,0 +1,407 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from db import Database, connector
+from changes import CHANGE_OVERLAP
+import warehouse_service
+import transport_service
+import restaurant_service
+
+# Замеры идут в отдельных базах: к имени рабочей базы добавляется суффикс, рабочие данные не затрагиваются
+BENCH_SUFFIX = "_bench"
+DEFAULT_VOLUMES = {"products": 100000, "vehicles": 10000, "orders": 1000000}
+SEED_CHUNK_SIZE = 5000
+# Данные генерируются с постоянным зерном, чтобы разные версии замерялись на одинаковых базах
+RANDOM_SEED = 42
+ORDER_HISTORY_DAYS = 730
+
+# Повторов каждой операции; тяжелые операции (полная выборка, отчеты) повторяются реже
+ITERATIONS = 200
+REPORT_ITERATIONS = 5
+PERCENTILES = (50, 90, 99)
+# При сравнении с прошлым замером операция считается замедлившейся, если p50 вырос больше чем в 1.2 раза
+REGRESSION_RATIO = 1.2
+# Строк, измененных перед замером опроса изменений, - столько строк вернет каждый опрос
+SYNC_CHANGED_ROWS = 100
+
+PRODUCT_WORDS = ("Молоко", "Сахар", "Мука", "Гвозди", "Краска", "Кабель", "Бумага", "Масло", "Чай", "Кофе",
+                 "Перчатки", "Шурупы", "Лампа", "Батарейка", "Скотч")
+SURNAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+            "Михайлов", "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев")
+DISHES = ("Пицца", "Борщ", "Салат Цезарь", "Паста", "Стейк", "Суп дня", "Пельмени", "Блины", "Чай", "Кофе",
+          "Морс", "Десерт", "Картофель фри", "Бургер", "Омлет", "Плов", "Шашлык", "Хачапури", "Лимонад", "Сок")
+VEHICLE_LETTERS = "АВЕКМНОРСТУХ"
+
+
+def bench_database(service):
+    database = Database(service.database.name + BENCH_SUFFIX)
+    if database.config["backend"] == "sqlite":
+        # Путь из db.ini (например, в общем разделе [mysql]) указывает на рабочий файл:
+        # файл замеров называется по имени базы и лежит рядом с ним
+        database.config["path"] = os.path.join(os.path.dirname(database.config["path"]),
+                                               f"{database.config['database']}.sqlite3")
+    return database
+
+
+def recreate_database(database):
+    params = database.params()
+    name = params.pop("database")
+    # Имя базы можно переопределить в db.ini; удаляется только база с суффиксом замеров
+    if not name.endswith(BENCH_SUFFIX):
+        raise ValueError(f"База {name} не похожа на базу для замеров (нет суффикса {BENCH_SUFFIX})")
+    if database.config["backend"] == "sqlite":
+        path = database.config["path"]
+        if not os.path.splitext(os.path.basename(path))[0].endswith(BENCH_SUFFIX):
+            raise ValueError(f"Файл {path} не похож на базу для замеров (нет суффикса {BENCH_SUFFIX})")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return
+    connection = connector().connect(**params)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+        cursor.execute(f"CREATE DATABASE `{name}` CHARACTER SET utf8mb4")
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def insert_chunks(db, total, make_chunk, progress):
+    # make_chunk(первый номер, число строк) записывает строки курсором; каждая пачка - отдельная транзакция
+    cursor = db.cursor()
+    try:
+        for start in range(0, total, SEED_CHUNK_SIZE):
+            make_chunk(cursor, start + 1, min(SEED_CHUNK_SIZE, total - start))
+            db.commit()
+            progress(min(start + SEED_CHUNK_SIZE, total), total)
+    finally:
+        cursor.close()
+
+
+def seed_warehouse(db, count, rng, now, progress):
+    suppliers = [f"ООО Поставщик {n}" for n in range(1, 501)]
+
+    def make_chunk(cursor, first, size):
+        products = []
+        movements = []
+        for product_id in range(first, first + size):
+            quantity = rng.randint(0, 1000)
+            operation_date = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            products.append((
+                product_id, f"{rng.choice(PRODUCT_WORDS)} {product_id}", rng.choice(suppliers), quantity,
+                round(rng.uniform(10, 5000), 2), operation_date.date(), "Поступление", operation_date,
+                "В наличии" if quantity > 0 else "Нет в наличии"
+            ))
+            movements.append((product_id, quantity, "Начальный остаток", quantity, operation_date))
+        cursor.executemany("""
+            INSERT INTO warehouse_data (
+                id, product_name, supplier_name, quantity, price,
+                last_delivery, last_operation, last_operation_date, status
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, products)
+        cursor.executemany("""
+            INSERT INTO stock_movements (product_id, delta, operation, quantity_after, created_at)
+            VALUES (%s, %s, %s, %s, %s)
+        """, movements)
+
+    insert_chunks(db, count, make_chunk, progress)
+
+
+def seed_transport(db, count, rng, now, progress):
+    today = now.date()
+
+    def make_chunk(cursor, first, size):
+        vehicles = []
+        for vehicle_id in range(first, first + size):
+            last_maintenance = today - timedelta(days=rng.randint(0, 45))
+            number = (f"{rng.choice(VEHICLE_LETTERS)}{vehicle_id % 1000:03d}"
+                      f"{rng.choice(VEHICLE_LETTERS)}{rng.choice(VEHICLE_LETTERS)}{vehicle_id // 1000 % 1000:03d}")
+            vehicles.append((
+                vehicle_id, f"{rng.choice(SURNAMES)} {rng.choice(VEHICLE_LETTERS)}.", number,
+                str(rng.randint(1, 300)), last_maintenance,
+                transport_service.next_maintenance_date(last_maintenance), "Активен"
+            ))
+        cursor.executemany("""
+            INSERT INTO transport_data (
+                id, driver_name, vehicle_number, route_number,
+                last_maintenance, next_maintenance, status
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, vehicles)
+
+    insert_chunks(db, count, make_chunk, progress)
+
+
+def seed_restaurant(db, count, rng, now, progress):
+    # Заказы идут по возрастанию даты; старше срока хранения - сразу в архив, как после --archive
+    boundary = restaurant_service.months_before(now, restaurant_service.ARCHIVE_KEEP_MONTHS)
+    history_start = now - timedelta(days=ORDER_HISTORY_DAYS)
+    step = ORDER_HISTORY_DAYS * 86400 / max(count, 1)
+
+    def make_chunk(cursor, first, size):
+        tables = {"restaurant_archive": [], "restaurant_data": []}
+        written = []
+        for order_id in range(first, first + size):
+            order_date = history_start + timedelta(seconds=int((order_id - 1) * step + rng.random() * step))
+            dishes = rng.sample(DISHES, rng.randint(1, 4))
+            items = ", ".join(f"{dish} x{rng.randint(1, 3)}" if rng.random() < 0.3 else dish for dish in dishes)
+            status = "Новый" if now - order_date < timedelta(hours=1) else "Выполнен"
+            table = "restaurant_archive" if order_date < boundary else "restaurant_data"
+            tables[table].append((order_id, f"Стол {rng.randint(1, 40)}", items,
+                                  round(rng.uniform(200, 5000), 2), order_date, status))
+            written.append((order_id, order_date, items))
+        for table, orders in tables.items():
+            if orders:
+                cursor.executemany(f"""
+                    INSERT INTO {table} (id, client_name, menu_items, order_total, order_date, status)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, orders)
+        restaurant_service.insert_order_items(cursor, written)
+
+    insert_chunks(db, count, make_chunk, progress)
+    restaurant_service.rebuild_rollup(db)
+
+
+def seed(app, db, count, now):
+    def progress(done, total):
+        print(f"\r{app}: {done}/{total}", end="", flush=True)
+
+    started = time.perf_counter()
+    rng = random.Random(RANDOM_SEED)
+    SEEDERS[app][1](db, count, rng, now, progress)
+    print(f"\r{app}: {count} строк за {time.perf_counter() - started:.1f} с")
+
+
+def table_ids(db, table):
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0), COUNT(*) FROM {table}")
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def sync_since(service, db, table):
+    # Отметка опроса берется после заполнения базы. Время изменения хранится с точностью до секунды, поэтому
+    # сначала пережидается секунда, в которой шло заполнение, затем изменяются SYNC_CHANGED_ROWS строк:
+    # опрос с этой отметки возвращает только их, как терминалу после правок на других терминалах
+    time.sleep(1)
+    since = service.operations["fetch_changes"](db, None)[0] + timedelta(seconds=CHANGE_OVERLAP)
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT id FROM {table} ORDER BY id DESC LIMIT %s", (SYNC_CHANGED_ROWS,))
+        ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            cursor.execute(f"UPDATE {table} SET updated_at = NOW() WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                           tuple(ids))
+        db.commit()
+    finally:
+        cursor.close()
+    return since
+
+
+def warehouse_cases(db, rng, now):
+    first, last, total = table_ids(db, "warehouse_data")
+    pages = max(1, total // warehouse_service.PAGE_SIZE)
+    page_size = warehouse_service.PAGE_SIZE
+    since = sync_since(warehouse_service.SERVICE, db, "warehouse_data")
+    return total, [
+        # Обновление таблицы: первые страницы и общее число строк, как при открытии окна
+        ("refresh_data", False, lambda: warehouse_service.fetch_pages(db, page_size, 0, 3, None, False, True)),
+        ("page_jump", False,
+         lambda: warehouse_service.fetch_pages(db, page_size, rng.randrange(pages), 1, None, False, False)),
+        # Опрос изменений вместо повторной загрузки таблицы; замеряется до операций, изменяющих строки
+        ("sync", False, lambda: warehouse_service.fetch_changes(db, since)),
+        ("update_quantity", False,
+         lambda: warehouse_service.apply_movement(db, rng.randint(first, last), 1, "Поступление")),
+        ("generate_report", True, lambda: warehouse_service.fetch_inventory_analysis(db)),
+    ]
+
+
+def transport_cases(db, rng, now):
+    total = table_ids(db, "transport_data")[2]
+    since = sync_since(transport_service.SERVICE, db, "transport_data")
+    return total, [
+        ("refresh_data", True, lambda: transport_service.fetch_vehicles(db)),
+        ("sync", False, lambda: transport_service.fetch_changes(db, since)),
+        ("search", False, lambda: transport_service.search_vehicles(db, rng.choice(SURNAMES)[:3])),
+        # Проверка ТО: планировщик загружает даты ТО и отправленные напоминания
+        ("check_maintenance", True, lambda: transport_service.fetch_maintenance_schedule(db)),
+    ]
+
+
+def restaurant_cases(db, rng, now):
+    total = table_ids(db, "restaurant_data")[2] + table_ids(db, "restaurant_archive")[2]
+
+    def add_order():
+        dishes = ", ".join(rng.sample(DISHES, rng.randint(1, 4)))
+        restaurant_service.insert_order(db, f"Стол {rng.randint(1, 40)}", dishes,
+                                        round(rng.uniform(200, 5000), 2), datetime.now(), "Новый")
+
+    month_start, _ = restaurant_service.report_period("month", now)
+    since = sync_since(restaurant_service.SERVICE, db, "restaurant_data")
+    return total, [
+        ("refresh_data", True, lambda: restaurant_service.fetch_orders(db)),
+        ("sync", False, lambda: restaurant_service.fetch_changes(db, since)),
+        ("add_order", False, add_order),
+        ("generate_report", False, lambda: restaurant_service.fetch_report_totals(db, "year", datetime.now())),
+        ("dish_sales", True, lambda: restaurant_service.fetch_dish_sales(db, month_start, datetime.now())),
+        ("summary", True, lambda: restaurant_service.fetch_summary(db, datetime.now())),
+    ]
+
+
+# Программа: (сервис, заполнение базы, операции для замера, объем данных по умолчанию)
+SEEDERS = {
+    "warehouse": (warehouse_service.SERVICE, seed_warehouse, warehouse_cases, "products"),
+    "transport": (transport_service.SERVICE, seed_transport, transport_cases, "vehicles"),
+    "restaurant": (restaurant_service.SERVICE, seed_restaurant, restaurant_cases, "orders"),
+}
+
+
+def percentile(values, p):
+    # values отсортированы; метод ближайшего ранга
+    return values[max(0, math.ceil(len(values) * p / 100) - 1)]
+
+
+def measure(fn, iterations):
+    fn()  # прогрев: подготовка запросов на сервере, кэш страниц InnoDB
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    # Пик памяти - отдельным прогоном: tracemalloc замедляет выполнение и исказил бы задержки
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    result = {"iterations": iterations}
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = round(percentile(timings, p), 3)
+    result["max_ms"] = round(timings[-1], 3)
+    result["mean_ms"] = round(sum(timings) / len(timings), 3)
+    result["peak_memory_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def run_cases(app, db, iterations, report_iterations):
+    rng = random.Random(RANDOM_SEED)
+    rows, cases = SEEDERS[app][2](db, rng, datetime.now())
+    results = {}
+    for name, heavy, fn in cases:
+        try:
+            results[name] = measure(fn, report_iterations if heavy else iterations)
+        except Exception as e:
+            # Например, нет NumPy для отчета склада: остальные операции замеряются
+            db.rollback()
+            results[name] = {"error": f"{type(e).__name__}: {str(e)}"}
+        print_result(f"{app}.{name}", results[name])
+    return rows, results
+
+
+def print_result(name, result):
+    if "error" in result:
+        print(f"  {name:<30} ошибка: {result['error']}")
+        return
+    print(f"  {name:<30} p50 {result['p50_ms']:>9.2f}  p90 {result['p90_ms']:>9.2f}  "
+          f"p99 {result['p99_ms']:>9.2f} мс  память {result['peak_memory_kb']:>9.0f} КБ")
+
+
+def source_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=sys.path[0] or ".").stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report, baseline_path):
+    # Сравнение p50 с прошлым замером; возвращает число замедлившихся операций
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} ({baseline.get('version') or 'версия неизвестна'}):")
+    regressions = 0
+    for app, current in report["apps"].items():
+        previous = baseline.get("apps", {}).get(app, {}).get("results", {})
+        for name, result in current["results"].items():
+            before = previous.get(name, {}).get("p50_ms")
+            if before is None or "p50_ms" not in result:
+                continue
+            ratio = result["p50_ms"] / before if before else 1
+            mark = ""
+            if ratio > REGRESSION_RATIO:
+                regressions += 1
+                mark = "  МЕДЛЕННЕЕ"
+            print(f"  {app}.{name:<25} {before:>9.2f} -> {result['p50_ms']:>9.2f} мс ({ratio:.2f}x){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры операций склада, транспорта и ресторана на синтетических данных")
+    parser.add_argument("apps", nargs="*", metavar="app",
+                        help=f"программы: {', '.join(SEEDERS)} (по умолчанию все)")
+    parser.add_argument("--seed", action="store_true",
+                        help=f"пересоздать базы *{BENCH_SUFFIX} и заполнить их синтетическими данными")
+    for volume, default in DEFAULT_VOLUMES.items():
+        parser.add_argument(f"--{volume}", type=int, default=default,
+                            help=f"объем данных при --seed (по умолчанию {default})")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS,
+                        help=f"повторов каждой операции (по умолчанию {ITERATIONS}; 0 - только заполнить базы)")
+    parser.add_argument("--report-iterations", type=int, default=REPORT_ITERATIONS,
+                        help=f"повторов тяжелых операций и отчетов (по умолчанию {REPORT_ITERATIONS})")
+    parser.add_argument("--json", dest="json_path", metavar="FILE", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="JSON прошлого замера; при замедлении операций код возврата 1")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.apps if name not in SEEDERS]
+    if unknown:
+        parser.error(f"неизвестные программы: {', '.join(unknown)}")
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "version": source_version(),
+        "python": platform.python_version(),
+        "apps": {},
+    }
+    try:
+        for app in args.apps or list(SEEDERS):
+            service, _, _, volume = SEEDERS[app]
+            database = bench_database(service)
+            if args.seed:
+                recreate_database(database)
+            db = database.connect()
+            service.call(db, "create_table", [])
+            if args.seed:
+                seed(app, db, getattr(args, volume), datetime.now())
+            if args.iterations > 0:
+                print(f"{app} ({database.config['database']}):")
+                rows, results = run_cases(app, db, args.iterations, args.report_iterations)
+                report["apps"][app] = {"database": database.config["database"], "rows": rows, "results": results}
+            database.discard()
+    except Exception as e:
+        # Ошибки MySQL и SQLite; драйвер MySQL не загружается, если база - файл SQLite
+        print(f"Ошибка базы данных: {str(e)}")
+        sys.exit(2)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline and report["apps"] and compare(report, args.baseline):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+from migrations import add_column, add_index, add_trigger, is_sqlite
+
+# Строки, измененные за это время до предыдущего опроса, читаются повторно: транзакция, начатая раньше,
+# может зафиксироваться позже опроса. Повтор безопасен - строки заменяются по id, с
+CHANGE_OVERLAP = 30
+# Удаленные строки хранятся столько дней; терминал, не опрашивавший базу дольше, перечитывает таблицу целиком
+TOMBSTONE_KEEP_DAYS = 7
+# Период опроса изменений с других терминалов, мс
+SYNC_INTERVAL = 5000
+
+TOMBSTONES = """
+    CREATE TABLE IF NOT EXISTS deleted_rows (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        table_name VARCHAR(64) NOT NULL,
+        row_id INT NOT NULL,
+        deleted_at DATETIME NOT NULL,
+        KEY idx_deleted_rows (table_name, deleted_at)
+    )
+"""
+
+
+def add_change_tracking(cursor, table):
+    # Время последнего изменения строки (updated_at) и запись об удалении строки в deleted_rows
+    cursor.execute(TOMBSTONES)
+    if is_sqlite(cursor):
+        # SQLite не добавляет столбец со значением по умолчанию CURRENT_TIMESTAMP и не знает ON UPDATE
+        add_column(cursor, table, "updated_at", "DATETIME")
+        cursor.execute(f"UPDATE {table} SET updated_at = NOW() WHERE updated_at IS NULL")
+        for event in ("INSERT", "UPDATE"):
+            add_trigger(cursor, f"{table}_touch_{event.lower()}", f"AFTER {event}", table,
+                        f"UPDATE {table} SET updated_at = NOW() WHERE id = NEW.id")
+    else:
+        add_column(cursor, table, "updated_at",
+                   "DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    add_index(cursor, table, f"idx_{table}_updated", "updated_at")
+    add_trigger(cursor, f"{table}_tombstone", "AFTER DELETE", table,
+                f"INSERT INTO deleted_rows (table_name, row_id, deleted_at) VALUES ('{table}', OLD.id, NOW())")
+
+
+def prune_tombstones(db, keep_days=TOMBSTONE_KEEP_DAYS):
+    cursor = db.cursor()
+    try:
+        cursor.execute("DELETE FROM deleted_rows WHERE deleted_at < %s", (datetime.now() - timedelta(days=keep_days),))
+        db.commit()
+    finally:
+        cursor.close()
+
+
+def fetch_changed_rows(db, table, columns, since, kept_in=None):
+    # -> (since для следующего опроса, строки с updated_at не раньше since, id удаленных строк,
+    # нужно ли перечитать таблицу целиком). Без since возвращается только отметка для следующего опроса.
+    # kept_in - таблица, куда строки переносятся (архив): такие строки не считаются удаленными
+    # Новый снимок данных: в REPEATABLE READ MySQL открытая транзакция видела бы данные своего начала
+    db.rollback()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT NOW()")
+        now = cursor.fetchone()[0]
+        watermark = now - timedelta(seconds=CHANGE_OVERLAP)
+        if since is None:
+            return watermark, [], [], False
+        if since < now - timedelta(days=TOMBSTONE_KEEP_DAYS):
+            return watermark, [], [], True
+
+        cursor.execute(f"SELECT {columns} FROM {table} WHERE updated_at >= %s", (since,))
+        rows = cursor.fetchall()
+        query = "SELECT DISTINCT row_id FROM deleted_rows WHERE table_name = %s AND deleted_at >= %s"
+        if kept_in is not None:
+            query += f" AND row_id NOT IN (SELECT id FROM {kept_in})"
+        cursor.execute(query, (table, since))
+        deleted = [row[0] for row in cursor.fetchall()]
+        return watermark, rows, deleted, False
+    finally:
+        cursor.close()
+
+
+def insert_position(tree, values, key, descending=False):
+    # Индекс строки в таблице, упорядоченной по key(values), - двоичным поиском по строкам Treeview
+    children = tree.get_children()
+    target = key(values)
+    low, high = 0, len(children)
+    while low < high:
+        middle = (low + high) // 2
+        current = key(tree.item(children[middle], "values"))
+        if (current > target) if descending else (current < target):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def patch_tree(tree, rows, deleted, key, descending=False, accept=None):
+    # Изменения применяются к строкам Treeview по iid = id, без перерисовки всей таблицы.
+    # Строка, сменившая место в порядке key, переставляется; accept(row) - показывать ли новую строку
+    for row_id in deleted:
+        if tree.exists(str(row_id)):
+            tree.delete(str(row_id))
+    for row in rows:
+        iid = str(row[0])
+        if tree.exists(iid):
+            moved = key(tree.item(iid, "values")) != key(row)
+            tree.item(iid, values=row)
+            if moved:
+                tree.detach(iid)
+                tree.move(iid, "", insert_position(tree, row, key, descending))
+        elif accept is None or accept(row):
+            tree.insert("", insert_position(tree, row, key, descending), iid=iid, values=row)
+
+
+class ChangePoller:
+    # Периодический опрос операции fetch_changes службы; без индикатора занятости и без окон с ошибками
+    def __init__(self, root, executor, service, on_changes, on_reload, args=lambda: (), interval=SYNC_INTERVAL):
+        # on_changes(строки, id удаленных) и on_reload() вызываются в потоке Tk; args() - доп. аргументы операции
+        self.root = root
+        self.executor = executor
+        self.service = service
+        self.on_changes = on_changes
+        self.on_reload = on_reload
+        self.args = args
+        self.interval = interval
+        self.since = None
+        self.started = False
+        # id удаленных строк из предыдущего ответа: окно CHANGE_OVERLAP возвращает их при каждом опросе
+        self.seen_deleted = set()
+
+    def start(self):
+        # Первый опрос идет после уже отправленной загрузки таблицы и дает отметку времени
+        if not self.started:
+            self.started = True
+            self.poll()
+
+    def poll(self):
+        self.executor.submit(self.service.bind("fetch_changes", self.since, *self.args()), self.received,
+                             self.failed, key="sync", quiet=True)
+
+    def received(self, result):
+        since, rows, deleted, reload = result
+        self.since = since
+        # Удаление, уже примененное предыдущим опросом, не передается снова - иначе каждая удаленная строка
+        # вызывала бы перезагрузку таблицы при каждом опросе, пока не выйдет из окна
+        fresh = [row_id for row_id in deleted if row_id not in self.seen_deleted]
+        self.seen_deleted = set(deleted)
+        if reload:
+            self.on_reload()
+        elif rows or fresh:
+            self.on_changes(rows, fresh)
+        self.root.after(self.interval, self.poll)
+
+    def failed(self, error):
+        # База недоступна - следующий опрос в свой срок
+        print(f"Ошибка при опросе изменений: {str(error)}")
+        self.root.after(self.interval, self.poll)
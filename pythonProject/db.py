@@ -0,0 +1,184 @@
+import configparser
+import os
+import threading
+import time
+import weakref
+
+# Параметры подключения: db.ini рядом с программой (или путь из APP_DB_CONFIG), затем переменные окружения
+CONFIG_PATH = os.environ.get("APP_DB_CONFIG",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "db.ini"))
+DEFAULTS = {
+    # mysql - сервер MySQL; sqlite - встроенная база в файле path, без сервера (один компьютер)
+    "backend": "mysql",
+    "host": "localhost",
+    "port": "3306",
+    "user": "root",
+    "password": "",
+    "pool_size": "5",
+}
+ENVIRONMENT = {
+    "backend": "DB_BACKEND",
+    "host": "DB_HOST",
+    "port": "DB_PORT",
+    "user": "DB_USER",
+    "password": "DB_PASSWORD",
+    "pool_size": "DB_POOL_SIZE",
+}
+
+# Соединение, простоявшее дольше этого времени, проверяется перед использованием
+IDLE_PING_SECONDS = 60
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 1
+
+# Подготовленные на сервере запросы кэшируются для каждого соединения
+_prepared_cursors = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def connector():
+    # mysql.connector загружается при первом подключении, а не при запуске программы
+    import mysql.connector.pooling
+    return mysql.connector
+
+
+def load_config(database):
+    parser = configparser.ConfigParser()
+    parser.read(CONFIG_PATH, encoding="utf-8")
+
+    config = dict(DEFAULTS)
+    for section in ("mysql", database):
+        if parser.has_section(section):
+            config.update(parser[section])
+    for key, variable in ENVIRONMENT.items():
+        if os.environ.get(variable):
+            config[key] = os.environ[variable]
+    config.setdefault("database", database)
+    config.setdefault("path", os.path.join(os.path.dirname(CONFIG_PATH), f"{config['database']}.sqlite3"))
+    return config
+
+
+def is_integrity_error(error):
+    # Нарушение уникальности в MySQL и SQLite без загрузки драйвера другой базы
+    return type(error).__name__ == "IntegrityError"
+
+
+def is_driver_error(error):
+    # Ошибка драйвера базы: у mysql.connector и sqlite3 общий базовый класс называется Error
+    return "Error" in error_names(error)
+
+
+# Ошибки, которые повторятся при повторе того же запроса: нарушение ключа, неверные данные, ошибка в запросе
+PERMANENT_ERRORS = {"IntegrityError", "DataError", "ProgrammingError", "NotSupportedError",
+                    "ValueError", "TypeError", "KeyError", "ServiceRejected"}
+# Сбой связи или блокировки: тот же запрос стоит повторить позже
+TRANSIENT_ERRORS = {"InterfaceError", "OperationalError", "InternalError", "PoolError",
+                    "ServiceUnavailable", "OSError"}
+# Коды MySQL: ожидание блокировки истекло, взаимная блокировка
+LOCK_ERRNOS = {1205, 1213}
+
+
+def error_names(error):
+    return {cls.__name__ for cls in type(error).__mro__}
+
+
+def is_permanent_error(error):
+    return bool(error_names(error) & PERMANENT_ERRORS)
+
+
+def is_transient_error(error):
+    return getattr(error, "errno", None) in LOCK_ERRNOS or bool(error_names(error) & TRANSIENT_ERRORS)
+
+
+class Database:
+    # Соединения одной базы (пул MySQL или файл SQLite); каждый поток держит собственное соединение
+    def __init__(self, database):
+        self.name = database
+        self.config = load_config(database)
+        self.pool = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def params(self):
+        return {
+            "host": self.config["host"],
+            "port": int(self.config["port"]),
+            "user": self.config["user"],
+            "password": self.config["password"],
+            "database": self.config["database"],
+        }
+
+    def open(self):
+        if self.config["backend"] == "sqlite":
+            # Пул не нужен: соединение с файлом открывается мгновенно
+            from sqlite_backend import SQLiteConnection
+            connection = SQLiteConnection(self.config["path"])
+        else:
+            connection = self.open_mysql()
+        # metrics импортирует db, поэтому импортируется здесь; без [metrics] соединение не оборачивается
+        from metrics import instrument
+        return instrument(connection)
+
+    def open_mysql(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = connector().pooling.MySQLConnectionPool(
+                    pool_name=f"{self.name}_pool",
+                    pool_size=int(self.config["pool_size"]),
+                    **self.params()
+                )
+        try:
+            return self.pool.get_connection()
+        except connector().pooling.PoolError:
+            # Все соединения пула заняты потоками - открывается отдельное
+            return connector().connect(**self.params())
+
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = self.open()
+        elif time.monotonic() - self.local.last_used > IDLE_PING_SECONDS:
+            # MySQL закрывает простаивающие соединения, поэтому перед работой - проверка с переподключением
+            try:
+                db.ping(reconnect=True, attempts=RECONNECT_ATTEMPTS, delay=RECONNECT_DELAY)
+                # После переподключения подготовленные запросы старой сессии недействительны
+                forget_prepared(db)
+            except Exception as error:
+                if not is_driver_error(error):
+                    raise
+                self.discard()
+                db = self.local.db = self.open()
+        self.local.last_used = time.monotonic()
+        return db
+
+    def discard(self):
+        # Соединение потока считается испорченным: закрывается, следующее будет открыто заново
+        db = getattr(self.local, "db", None)
+        self.local.db = None
+        if db is not None:
+            forget_prepared(db)
+            try:
+                db.close()
+            except Exception as error:
+                if not is_driver_error(error):
+                    raise
+
+
+def prepared(db, query):
+    # Курсор с подготовленным на сервере запросом; повторные вызовы с тем же текстом используют его же
+    with _prepared_lock:
+        cursors = _prepared_cursors.setdefault(db, {})
+        cursor = cursors.get(query)
+        if cursor is None:
+            cursor = cursors[query] = db.cursor(prepared=True)
+    return cursor
+
+
+def forget_prepared(db):
+    with _prepared_lock:
+        cursors = _prepared_cursors.pop(db, {})
+    for cursor in cursors.values():
+        try:
+            cursor.close()
+        except Exception as error:
+            if not is_driver_error(error):
+                raise
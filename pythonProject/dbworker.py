@@ -0,0 +1,135 @@
+import queue
+import threading
+from tkinter import messagebox
+from metrics import METRICS
+
+# Период опроса очереди результатов из главного цикла Tk, мс
+POLL_INTERVAL = 50
+
+
+class Job:
+    def __init__(self, fn, on_done, on_error, key, quiet):
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.key = key
+        self.quiet = quiet
+        self.started = False
+        self.cancelled = False
+
+
+class QueryExecutor:
+    # Выполняет запросы в рабочих потоках, обратные вызовы - в потоке Tk через root.after
+    def __init__(self, root, database, workers=1, on_busy=None):
+        # database - объект с методами connect() (соединение текущего потока) и discard()
+        self.root = root
+        self.database = database
+        self.on_busy = on_busy
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.active = 0
+        self.busy = False
+
+        for _ in range(workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+        self.root.after(POLL_INTERVAL, self.drain)
+
+    def submit(self, fn, on_done=None, on_error=None, key=None, quiet=False):
+        # fn(db) выполняется в рабочем потоке; задание с тем же ключом вытесняет предыдущее.
+        # quiet - фоновое задание (опрос изменений), которое не включает индикатор занятости
+        with self.lock:
+            previous = self.latest.get(key) if key is not None else None
+            if previous is not None and not previous.started and not previous.cancelled:
+                # Еще не начатое задание просто получает новые параметры - повторные запросы склеиваются
+                previous.fn, previous.on_done, previous.on_error = fn, on_done, on_error
+                return previous
+
+            if previous is not None:
+                previous.cancelled = True
+
+            job = Job(fn, on_done, on_error, key, quiet)
+            if key is not None:
+                self.latest[key] = job
+            if not quiet:
+                self.active += 1
+
+        self.set_busy()
+        self.tasks.put(job)
+        return job
+
+    def cancel(self, key):
+        with self.lock:
+            job = self.latest.pop(key, None)
+            if job is not None:
+                job.cancelled = True
+
+    def call_soon(self, fn, *args):
+        # Безопасно вызывается из рабочего потока: fn будет выполнена в потоке Tk
+        self.results.put((None, fn, args))
+
+    def worker(self):
+        while True:
+            job = self.tasks.get()
+            with self.lock:
+                if job.cancelled:
+                    self.results.put((job, None, None))
+                    continue
+                job.started = True
+                fn = job.fn
+
+            try:
+                result = fn(self.database.connect())
+                self.results.put((job, result, None))
+            except Exception as e:
+                METRICS.record_error("job", e)
+                self.reset_connection()
+                self.results.put((job, None, e))
+
+    def reset_connection(self):
+        try:
+            self.database.connect().rollback()
+        except Exception:
+            # Соединение потеряно - в следующем задании будет открыто новое
+            self.database.discard()
+
+    def drain(self):
+        try:
+            while True:
+                try:
+                    job, result, error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+
+                if job is None:
+                    # Вызов, переданный из рабочего потока через call_soon
+                    fn, args = result, error
+                    fn(*args)
+                    continue
+
+                with self.lock:
+                    if not job.quiet:
+                        self.active -= 1
+                    if job.key is not None and self.latest.get(job.key) is job:
+                        del self.latest[job.key]
+
+                if job.cancelled:
+                    continue
+                if error is not None:
+                    (job.on_error or self.show_error)(error)
+                elif job.on_done is not None:
+                    job.on_done(result)
+        finally:
+            self.set_busy()
+            self.root.after(POLL_INTERVAL, self.drain)
+
+    def set_busy(self):
+        busy = self.active > 0
+        if busy != self.busy:
+            self.busy = busy
+            if self.on_busy is not None:
+                self.on_busy(busy)
+
+    def show_error(self, error):
+        messagebox.showerror("Ошибка", str(error))
@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from db import is_permanent_error, is_transient_error
+from service import decode, encode, error_payload
+
+# Записей в одной пачке, отправляемой в базу
+JOURNAL_BATCH_SIZE = 50
+# Пауза перед повтором, если база или сервер недоступны, с
+JOURNAL_RETRY_DELAY = 5
+# Попыток переноса записи, которая не проходит из-за неизвестной ошибки, до переноса в файл отклоненных
+JOURNAL_MAX_ATTEMPTS = 5
+
+# Ключи операций, уже примененных из журналов терминалов: повтор пачки после сбоя их пропускает.
+# error - текст отказа, если операция была отклонена (например, не хватило товара)
+APPLIED_OPERATIONS = """
+    CREATE TABLE IF NOT EXISTS applied_operations (
+        operation_key CHAR(32) PRIMARY KEY,
+        operation VARCHAR(50) NOT NULL,
+        applied_at DATETIME NOT NULL,
+        error VARCHAR(255)
+    )
+"""
+
+
+class WriteJournal(ABC):
+    # Журнал предзаписи: запись сразу сохраняется в локальный файл (только добавление, с fsync),
+    # поток переносит записи в базу пачками по порядку и убирает из файла после подтверждения.
+    # Запись, которую база отклоняет, уходит в файл <path>.failed и не задерживает остальные
+    def __init__(self, database, path, batch_size=JOURNAL_BATCH_SIZE, delay=0, retry_delay=JOURNAL_RETRY_DELAY,
+                 prepare=None, max_attempts=JOURNAL_MAX_ATTEMPTS):
+        # database - соединение для SERVICE.bind: Database или клиент сервера.
+        # prepare(db) - задание перед первой пачкой (миграции); повторяется, пока база недоступна
+        self.database = database
+        self.path = path
+        self.prepare = prepare
+        self.batch_size = batch_size
+        # Ожидание перед отправкой пачки, чтобы в нее попали записи, поступившие почти одновременно, с
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.failed_path = path + ".failed"
+        self.condition = threading.Condition()
+        self.pending = self.load()
+
+    def encode_record(self, record):
+        return json.dumps(record, ensure_ascii=False)
+
+    def decode_record(self, line):
+        return json.loads(line)
+
+    def load(self):
+        # Записи, не перенесенные в базу до закрытия программы; ключи записей не дадут дубликатов
+        pending = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        pending.append(self.decode_record(line))
+                    except ValueError:
+                        # Строка, оборванная при аварийном завершении
+                        continue
+        except FileNotFoundError:
+            pass
+        return pending
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def count(self):
+        with self.condition:
+            return len(self.pending)
+
+    def snapshot(self):
+        with self.condition:
+            return list(self.pending)
+
+    def append(self, record):
+        # Запись подтверждается только после того, как она на диске
+        with self.condition:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(self.encode_record(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.append(record)
+            self.condition.notify()
+        return record
+
+    def save(self):
+        # Файл переписывается оставшейся очередью; вызывается под self.condition
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for record in self.pending:
+                f.write(self.encode_record(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def next_batch(self):
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+        if self.delay:
+            time.sleep(self.delay)
+        with self.condition:
+            return self.pending[:self.batch_size]
+
+    @abstractmethod
+    def apply(self, batch):
+        # Перенос пачки в базу; возвращает результаты в порядке записей
+        pass
+
+    def applied(self, batch, results, remaining):
+        # Вызывается из потока записи после того, как пачка убрана из файла
+        pass
+
+    def rejection(self, error):
+        # Результат записи, которую база отклонила
+        return {"error": error_payload(error)}
+
+    def report(self, error):
+        print(f"Ошибка при переносе журнала {os.path.basename(self.path)}: {str(error)}")
+
+    def reset(self):
+        # Незавершенная транзакция откатывается; соединение, которое не отвечает, закрывается
+        try:
+            self.database.connect().rollback()
+        except Exception:
+            self.database.discard()
+
+    def reject(self, record, error):
+        # Отклоненная запись сохраняется в файл отклоненных, чтобы ее можно было разобрать вручную
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"failed_at": datetime.now().isoformat(timespec="seconds"), "error": str(error),
+                                "record": self.encode_record(record)}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return self.rejection(error)
+
+    def apply_each(self, batch, give_up):
+        # Записи пачки переносятся по одной, чтобы отделить неверную от остальных.
+        # Возвращает перенесенное начало пачки и его результаты; запись со сбоем связи и все после нее остаются
+        results = []
+        for record in batch:
+            try:
+                results.extend(self.apply([record]))
+                continue
+            except Exception as e:
+                self.report(e)
+                self.reset()
+                if is_transient_error(e) or not (give_up or is_permanent_error(e)):
+                    break
+                results.append(self.reject(record, e))
+        return batch[:len(results)], results
+
+    def run(self):
+        prepared = self.prepare is None
+        # Сколько раз подряд пачка не прошла из-за ошибки, которая не похожа на сбой связи
+        failures = 0
+        while True:
+            batch = self.next_batch()
+            try:
+                db = self.database.connect()
+                if not prepared:
+                    self.prepare(db)
+                    prepared = True
+            except Exception as e:
+                self.report(e)
+                self.database.discard()
+                time.sleep(self.retry_delay)
+                continue
+
+            try:
+                results = self.apply(batch)
+            except Exception as e:
+                self.report(e)
+                self.reset()
+                if is_transient_error(e):
+                    # База или сервер недоступны, заняты блокировкой - пачка повторяется целиком
+                    time.sleep(self.retry_delay)
+                    continue
+                failures += 1
+                batch, results = self.apply_each(batch, failures >= self.max_attempts)
+                if not batch:
+                    time.sleep(self.retry_delay)
+                    continue
+            failures = 0
+
+            with self.condition:
+                del self.pending[:len(batch)]
+                self.save()
+                remaining = len(self.pending)
+            self.applied(batch, results, remaining)
+
+
+class OperationJournal(WriteJournal):
+    # Журнал операций службы: операция с аргументами и ключом, по которому сервер узнает повтор
+    def __init__(self, service, database, path, on_applied=None, **kwargs):
+        # on_applied(записи, результаты, осталось в очереди) вызывается из потока записи
+        self.service = service
+        self.on_applied = on_applied
+        super().__init__(database, path, **kwargs)
+
+    def encode_record(self, record):
+        # Даты и Decimal сохраняются с пометкой типа, как при передаче на сервер
+        return encode(record).decode("utf-8")
+
+    def decode_record(self, line):
+        return decode(line)
+
+    def submit(self, operation, *args):
+        if operation not in self.service.operations:
+            raise KeyError(f"Неизвестная операция {self.service.name}.{operation}")
+        return self.append({"key": uuid.uuid4().hex, "operation": operation, "args": list(args)})
+
+    def apply(self, batch):
+        return self.service.bind("replay_journal", [
+            (record["key"], record["operation"], record["args"]) for record in batch
+        ])(self.database.connect())
+
+    def applied(self, batch, results, remaining):
+        if self.on_applied is not None:
+            self.on_applied(batch, results, remaining)
+
+
+def replay_operations(service, db, entries):
+    # Применение записей журнала по порядку. Ключ фиксируется в одной транзакции с операцией,
+    # поэтому повтор пачки после обрыва связи не применит операцию дважды.
+    # Результат каждой записи: {"result": ...}, {"error": ...} (операция отклонена) или {"duplicate": True}
+    results = []
+    for key, operation, args in entries:
+        cursor = db.cursor()
+        try:
+            cursor.execute("""
+                INSERT IGNORE INTO applied_operations (operation_key, operation, applied_at)
+                VALUES (%s, %s, NOW())
+            """, (key, operation))
+            if cursor.rowcount == 0:
+                db.rollback()
+                results.append({"duplicate": True})
+                continue
+        finally:
+            cursor.close()
+
+        try:
+            results.append({"result": service.call(db, operation, args)})
+        except Exception as e:
+            db.rollback()
+            if not (service.is_expected(e) or is_permanent_error(e)):
+                # Сбой базы: пачка будет отправлена повторно
+                raise
+            # Отказ окончательный (нарушение ключа, неверные данные) - ключ сохраняется,
+            # чтобы повтор не применил операцию позже
+            cursor = db.cursor()
+            try:
+                cursor.execute("""
+                    INSERT INTO applied_operations (operation_key, operation, applied_at, error)
+                    VALUES (%s, %s, NOW(), %s)
+                """, (key, operation, str(e)[:255]))
+                db.commit()
+            finally:
+                cursor.close()
+            results.append({"error": error_payload(e)})
+    return results
@@ -0,0 +1,301 @@
+import atexit
+import configparser
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from db import CONFIG_PATH
+
+# Раздел [metrics] в db.ini; по умолчанию замеры выключены и соединения не оборачиваются
+DEFAULTS = {
+    "enabled": "no",
+    # Запросы дольше этого времени и задержки главного цикла дольше lag_threshold_ms пишутся в журнал
+    "slow_query_ms": "200",
+    "slow_log": "slow_{app}.log",
+    # Период проверки главного цикла Tk через root.after
+    "lag_interval_ms": "100",
+    "lag_threshold_ms": "200",
+    # Файл метрик: *.jsonl - строка JSON на каждую выгрузку, иначе текстовый формат Prometheus
+    "dump_path": "metrics_{app}.prom",
+    "dump_interval": "30",
+}
+# Границы гистограмм длительности запросов и задержки главного цикла, с
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Списки IN (%s, %s, ...) разной длины считаются одним запросом
+PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+
+
+def load_settings():
+    parser = configparser.ConfigParser()
+    parser.read(CONFIG_PATH, encoding="utf-8")
+    settings = dict(DEFAULTS)
+    if parser.has_section("metrics"):
+        settings.update(parser["metrics"])
+    return settings
+
+
+def normalize(statement):
+    return PLACEHOLDER_LIST.sub("%s, ...", " ".join(str(statement).split()))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def count(self):
+        return sum(self.counts)
+
+
+class Metrics:
+    # Счетчики запросов, ошибок и задержек главного цикла одного процесса; пишутся из любых потоков
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settings = None
+        self.app = "app"
+        self.started = time.time()
+        # Текст запроса -> [выполнений, всего с, максимум с, строк, ошибок, медленных]
+        self.statements = {}
+        self.durations = Histogram()
+        self.lag = Histogram()
+        self.errors = {}
+
+    def configure(self, app=None):
+        with self.lock:
+            if app is not None:
+                self.app = app
+            if self.settings is None:
+                self.settings = load_settings()
+            return self.settings
+
+    @property
+    def enabled(self):
+        settings = self.settings or self.configure()
+        return settings["enabled"].strip().lower() in ("1", "yes", "true", "on")
+
+    def path(self, key):
+        return self.settings[key].format(app=self.app)
+
+    def record_statement(self, statement, seconds, rows, error=False):
+        text = normalize(statement)
+        slow = seconds * 1000 >= float(self.settings["slow_query_ms"])
+        with self.lock:
+            entry = self.statements.setdefault(text, [0, 0.0, 0.0, 0, 0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] += max(rows, 0)
+            entry[4] += error
+            entry[5] += slow
+            self.durations.add(seconds)
+        if slow:
+            self.log("query", seconds, statement=text, rows=max(rows, 0), error=error)
+
+    def add_rows(self, statement, rows):
+        # Строки результата, полученные после выполнения (курсор без буферизации, подготовленный запрос)
+        with self.lock:
+            entry = self.statements.get(normalize(statement))
+            if entry is not None:
+                entry[3] += rows
+
+    def record_lag(self, seconds):
+        with self.lock:
+            self.lag.add(seconds)
+        if seconds * 1000 >= float(self.settings["lag_threshold_ms"]):
+            self.log("lag", seconds)
+
+    def record_error(self, source, error):
+        # Ошибки заданий, которые пользователь видит только в окне сообщения
+        if not self.enabled:
+            return
+        kind = f"{source}:{type(error).__name__}"
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.log("error", 0, source=source, error=f"{type(error).__name__}: {str(error)}")
+
+    def log(self, kind, seconds, **fields):
+        entry = {"time": datetime.now().isoformat(timespec="milliseconds"), "app": self.app,
+                 "kind": kind, "ms": round(seconds * 1000, 1)}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            with open(self.path("slow_log"), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def snapshot(self):
+        with self.lock:
+            statements = sorted(self.statements.items(), key=lambda item: -item[1][1])
+            return {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "app": self.app,
+                "uptime_s": round(time.time() - self.started, 1),
+                "statements": [
+                    {"statement": text, "count": count, "total_ms": round(total * 1000, 1),
+                     "max_ms": round(longest * 1000, 1), "rows": rows, "errors": errors, "slow": slow}
+                    for text, (count, total, longest, rows, errors, slow) in statements
+                ],
+                "lag": {"samples": self.lag.count(), "total_ms": round(self.lag.total * 1000, 1),
+                        "max_ms": round(self.lag.max * 1000, 1)},
+                "errors": dict(self.errors),
+            }
+
+    def prometheus(self):
+        app = label(self.app)
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{{{labels}}} {value}" for labels, value in samples)
+
+        def histogram(name, values):
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), values.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{app="{app}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{app="{app}"}} {values.total:.6f}')
+            lines.append(f'{name}_count{{app="{app}"}} {cumulative}')
+
+        with self.lock:
+            statements = [(f'app="{app}",statement="{label(text)}"', entry)
+                          for text, entry in self.statements.items()]
+            metric("app_sql_statements_total", "counter", [(key, entry[0]) for key, entry in statements])
+            metric("app_sql_seconds_total", "counter", [(key, f"{entry[1]:.6f}") for key, entry in statements])
+            metric("app_sql_seconds_max", "gauge", [(key, f"{entry[2]:.6f}") for key, entry in statements])
+            metric("app_sql_rows_total", "counter", [(key, entry[3]) for key, entry in statements])
+            metric("app_sql_errors_total", "counter", [(key, entry[4]) for key, entry in statements])
+            metric("app_sql_slow_total", "counter", [(key, entry[5]) for key, entry in statements])
+            histogram("app_sql_duration_seconds", self.durations)
+            histogram("app_mainloop_lag_seconds", self.lag)
+            metric("app_mainloop_lag_seconds_max", "gauge", [(f'app="{app}"', f"{self.lag.max:.6f}")])
+            metric("app_errors_total", "counter", [(f'app="{app}",kind="{label(kind)}"', count)
+                                                    for kind, count in self.errors.items()])
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        path = self.path("dump_path")
+        if path.endswith(".jsonl"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+            return
+        # Файл заменяется целиком, чтобы сборщик метрик не прочитал его наполовину записанным
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(temp_path, path)
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class TimedCursor:
+    # Курсор, который сообщает время и число строк каждого запроса
+    def __init__(self, cursor, metrics):
+        self.cursor = cursor
+        self.metrics = metrics
+        self.statement = None
+        self.counted = 0
+
+    def run(self, method, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = method(operation, *args, **kwargs)
+        except Exception:
+            self.metrics.record_statement(operation, time.perf_counter() - started, 0, error=True)
+            raise
+        self.statement = operation
+        self.counted = max(self.cursor.rowcount, 0)
+        self.metrics.record_statement(operation, time.perf_counter() - started, self.counted)
+        return result
+
+    def execute(self, operation, *args, **kwargs):
+        return self.run(self.cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self.run(self.cursor.executemany, operation, *args, **kwargs)
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        if self.statement is not None and len(rows) > self.counted:
+            self.metrics.add_rows(self.statement, len(rows) - self.counted)
+            self.counted = len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class TimedConnection:
+    # Соединение, курсоры которого замеряют запросы; остальное передается соединению как есть
+    def __init__(self, connection, metrics):
+        self.connection = connection
+        self.metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self.connection.cursor(*args, **kwargs), self.metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class LagMonitor:
+    # Задержка главного цикла Tk: насколько позже назначенного срабатывает root.after
+    def __init__(self, root, metrics, interval_ms):
+        self.root = root
+        self.metrics = metrics
+        self.interval_ms = interval_ms
+        self.expected = None
+        self.schedule()
+
+    def schedule(self):
+        self.expected = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self.tick)
+
+    def tick(self):
+        self.metrics.record_lag(max(0.0, time.perf_counter() - self.expected))
+        self.schedule()
+
+
+METRICS = Metrics()
+
+
+def instrument(connection):
+    # Вызывается для каждого нового соединения с базой
+    if not METRICS.enabled:
+        return connection
+    return TimedConnection(connection, METRICS)
+
+
+def dump_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            METRICS.dump()
+        except OSError as e:
+            print(f"Не удалось сохранить метрики: {str(e)}")
+
+
+def start(app, root=None):
+    # Включает проверку главного цикла (если передан root) и периодическую выгрузку метрик
+    settings = METRICS.configure(app)
+    if not METRICS.enabled:
+        return
+    if root is not None:
+        LagMonitor(root, METRICS, int(settings["lag_interval_ms"]))
+    threading.Thread(target=dump_periodically, args=(float(settings["dump_interval"]),), daemon=True).start()
+    atexit.register(METRICS.dump)
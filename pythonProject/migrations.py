@@ -0,0 +1,115 @@
+from datetime import datetime
+
+# Ожидание блокировки схемы, если несколько терминалов запускаются одновременно
+SCHEMA_LOCK_NAME = "schema_migrations"
+SCHEMA_LOCK_TIMEOUT = 30
+
+
+def is_sqlite(cursor):
+    return getattr(cursor, "dialect", None) == "sqlite"
+
+
+def column_exists(cursor, table, column):
+    if is_sqlite(cursor):
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s", (table, column))
+        return cursor.fetchone()[0] > 0
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    if is_sqlite(cursor):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+        return cursor.fetchone()[0] > 0
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def trigger_exists(cursor, trigger):
+    if is_sqlite(cursor):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name = %s", (trigger,))
+        return cursor.fetchone()[0] > 0
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.triggers
+        WHERE trigger_schema = DATABASE() AND trigger_name = %s
+    """, (trigger,))
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(cursor, table, column, definition):
+    # Базы, созданные до появления миграций, могут уже содержать столбец
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def add_index(cursor, table, index, columns, unique=False):
+    if not index_exists(cursor, table, index):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cursor.execute(f"CREATE {kind} {index} ON {table} ({columns})")
+
+
+def add_trigger(cursor, trigger, event, table, statement):
+    # Триггер из одного оператора; в SQLite тело триггера заключается в BEGIN ... END
+    if not trigger_exists(cursor, trigger):
+        body = f"BEGIN {statement}; END" if is_sqlite(cursor) else statement
+        cursor.execute(f"CREATE TRIGGER {trigger} {event} ON {table} FOR EACH ROW {body}")
+
+
+def run_migrations(db, migrations):
+    # migrations - список (версия, описание, список SQL или функция от курсора)
+    cursor = db.cursor()
+    sqlite = is_sqlite(cursor)
+    if sqlite:
+        # В SQLite нет GET_LOCK: блокировкой служит транзакция записи, взятая до чтения версии.
+        # DDL в SQLite транзакционный, поэтому все миграции фиксируются вместе в конце
+        db.begin()
+    else:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            cursor.close()
+            raise RuntimeError("Не удалось получить блокировку схемы базы данных")
+
+    applied = []
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at DATETIME
+            )
+        """)
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cursor.fetchone()[0]
+
+        for version, description, migration in sorted(migrations, key=lambda m: m[0]):
+            if version <= current:
+                continue
+
+            # DDL в MySQL фиксируется сразу, поэтому версия записывается после каждой миграции
+            if callable(migration):
+                migration(cursor)
+            else:
+                for statement in migration:
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)",
+                           (version, description, datetime.now()))
+            if not sqlite:
+                db.commit()
+            applied.append(version)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if not sqlite:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK_NAME,))
+            cursor.fetchone()
+        cursor.close()
+    return applied
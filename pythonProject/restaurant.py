@@ -1,8 +1,68 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import mysql.connector
-from datetime import datetime, timedelta
+from tkinter import ttk, messagebox, filedialog
+from dbworker import QueryExecutor
+from journal import WriteJournal
+from changes import ChangePoller, patch_tree
+import metrics
+from service import ServiceClient
+from restaurant_service import (
+    DATABASE, SERVICE, ARCHIVE_KEEP_MONTHS, create_table, rebuild_rollup, archive_orders, months_before,
+    export_orders_csv, report_period, write_summary_report
+)
+from datetime import datetime
+import argparse
+import json
 import os
+import uuid
+
+# Заказы сначала пишутся в локальный файл, затем пачками в базу
+RUSH_SPILL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rush_orders.jsonl")
+RUSH_BATCH_SIZE = 50
+# Режим час пик: ожидание перед записью пачки, чтобы собрать заказы нескольких касс, с
+RUSH_COMMIT_DELAY = 1
+# Пауза перед повтором, если база недоступна, с
+RUSH_RETRY_DELAY = 5
+
+
+class OrderWriter(WriteJournal):
+    # Отложенная запись заказов: заказ сразу сохраняется в локальный файл, поток пишет их в базу пачками
+    def __init__(self, database, spill_path=RUSH_SPILL_PATH, on_written=None, prepare=None):
+        # on_written(записанные {ключ: id}, отклоненные {ключ: (клиент, ошибка)}, осталось в очереди)
+        # вызывается из потока записи
+        self.on_written = on_written
+        super().__init__(database, spill_path, batch_size=RUSH_BATCH_SIZE, retry_delay=RUSH_RETRY_DELAY,
+                         prepare=prepare)
+
+    def encode_record(self, record):
+        return json.dumps(dict(record, order_date=record["order_date"].isoformat()), ensure_ascii=False)
+
+    def decode_record(self, line):
+        record = json.loads(line)
+        record["order_date"] = datetime.fromisoformat(record["order_date"])
+        return record
+
+    def set_rush_mode(self, enabled):
+        self.delay = RUSH_COMMIT_DELAY if enabled else 0
+
+    def enqueue(self, client, items, total, order_date, status):
+        return self.append({"token": uuid.uuid4().hex, "client": client, "items": items, "total": total,
+                            "order_date": order_date, "status": status})
+
+    def apply(self, batch):
+        # Ключ заказа уникален в базе: повтор пачки после сбоя не создаст дубликатов
+        return SERVICE.bind("write_orders", [
+            (record["token"], record["client"], record["items"], record["total"],
+             record["order_date"], record["status"]) for record in batch
+        ])(self.database.connect())
+
+    def applied(self, batch, results, remaining):
+        # Для отклоненного заказа вместо id приходит {"error": ...}
+        if self.on_written is not None:
+            self.on_written({record["token"]: result for record, result in zip(batch, results)
+                             if not isinstance(result, dict)},
+                            {record["token"]: (record["client"], result["error"]) for record, result in zip(batch, results)
+                             if isinstance(result, dict)},
+                            remaining)
 
 
 class RestaurantApp:
@@ -11,33 +71,29 @@ class RestaurantApp:
         self.root.title("Система управления рестораном")
         self.root.geometry("800x600")
 
-        # Подключение к базе данных
-        self.db = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="12345678",
-            database="restaurant_db"
-        )
-        self.cursor = self.db.cursor()
+        # Время запросов, задержки главного цикла и ошибки - если включено в разделе [metrics] db.ini
+        metrics.start("restaurant", self.root)
+
+        # Все запросы к базе выполняются в фоновом потоке
+        backend = SERVICE.backend()
+        self.executor = QueryExecutor(self.root, backend, on_busy=self.set_busy)
 
         # Создание таблицы, если она не существует
-        self.create_table()
+        self.executor.submit(SERVICE.bind("create_table"))
+
+        # Новые заказы и оставшиеся с прошлого запуска записываются в базу, когда она доступна
+        self.writer = OrderWriter(backend, prepare=SERVICE.bind("create_table"),
+                                  on_written=lambda written, rejected, remaining: self.executor.call_soon(
+                                      self.orders_written, written, rejected, remaining))
+        self.writer.start()
 
         # Создание интерфейса
         self.create_gui()
 
-    def create_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS restaurant_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                client_name VARCHAR(100),
-                menu_items TEXT,
-                order_total DECIMAL(10, 2),
-                order_date DATETIME,
-                status VARCHAR(20)
-            )
-        """)
-        self.db.commit()
+    def set_busy(self, busy):
+        self.root.configure(cursor="watch" if busy else "")
+        if hasattr(self, "status_label"):
+            self.status_label.configure(text="Загрузка..." if busy else "")
 
     def create_gui(self):
         # Фрейм для авторизации
@@ -71,6 +127,12 @@ class RestaurantApp:
 
         ttk.Button(order_frame, text="Добавить заказ", command=self.add_order).grid(row=3, column=0, columnspan=2,
                                                                                     pady=10)
+        self.rush_mode = tk.BooleanVar()
+        ttk.Checkbutton(order_frame, text="Режим час пик", variable=self.rush_mode,
+                        command=lambda: self.writer.set_rush_mode(self.rush_mode.get())).grid(
+            row=4, column=0, padx=5, pady=5, sticky="w")
+        self.pending_label = ttk.Label(order_frame, text="")
+        self.pending_label.grid(row=4, column=1, padx=5, pady=5, sticky="w")
 
         # Таблица заказов
         self.tree = ttk.Treeview(self.main_frame, columns=("ID", "Клиент", "Заказ", "Сумма", "Дата", "Статус"),
@@ -95,6 +157,16 @@ class RestaurantApp:
                                                                                                          padx=5)
         ttk.Button(btn_frame, text="Отчет за год", command=lambda: self.generate_report("year")).pack(side="left",
                                                                                                       padx=5)
+        ttk.Button(btn_frame, text="Продажи блюд", command=self.generate_dish_report).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Сводный отчет", command=self.generate_summary).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Экспорт CSV", command=self.export_orders).pack(side="left", padx=5)
+        self.show_archive = tk.BooleanVar()
+        ttk.Checkbutton(btn_frame, text="Показывать архив", variable=self.show_archive,
+                        command=self.refresh_orders).pack(side="left", padx=5)
+
+        # Строка состояния
+        self.status_label = ttk.Label(self.main_frame, text="")
+        self.status_label.pack(anchor="w", padx=10)
 
     def login(self):
         role = self.role_var.get()
@@ -107,6 +179,11 @@ class RestaurantApp:
         self.current_role = role
         self.refresh_orders()
 
+        # Изменения с других касс применяются к таблице на месте
+        self.poller = ChangePoller(self.root, self.executor, SERVICE, self.apply_changes, self.refresh_orders,
+                                   args=lambda: (self.show_archive.get(),))
+        self.poller.start()
+
     def add_order(self):
         client = self.client_name.get()
         items = self.menu_items.get()
@@ -122,15 +199,53 @@ class RestaurantApp:
             messagebox.showerror("Ошибка", "Неверный формат суммы!")
             return
 
-        query = "INSERT INTO restaurant_data (client_name, menu_items, order_total, order_date, status) VALUES (%s, %s, %s, %s, %s)"
-        values = (client, items, total, datetime.now(), "Новый")
-        self.cursor.execute(query, values)
-        self.db.commit()
-
+        # Заказ сразу показывается в таблице, в базу его запишет OrderWriter - и при недоступной базе
+        record = self.writer.enqueue(client, items, total, datetime.now(), "Новый")
+        self.show_pending(record)
         self.client_name.delete(0, tk.END)
         self.menu_items.delete(0, tk.END)
         self.order_total.delete(0, tk.END)
-        self.refresh_orders()
+        self.update_pending_label(self.writer.count())
+
+    def show_pending(self, record):
+        # Строка незаписанного заказа: вместо ID - пусто, iid - ключ заказа
+        if not self.tree.exists(record["token"]):
+            self.tree.insert("", 0, iid=record["token"], values=(
+                "", record["client"], record["items"], record["total"],
+                record["order_date"].strftime("%Y-%m-%d %H:%M:%S"), record["status"]))
+
+    def update_pending_label(self, remaining):
+        self.pending_label.configure(text=f"Ожидают записи: {remaining}" if remaining else "")
+
+    def orders_written(self, written, rejected, remaining):
+        for token, order_id in written.items():
+            if not self.tree.exists(token):
+                continue
+            # Строка записанного заказа получает iid = ID, по нему ее находит опрос изменений.
+            # Если заказ уже был записан раньше (повтор после сбоя) или опрос успел его показать - строка убирается
+            if order_id is not None and not self.tree.exists(str(order_id)):
+                values = list(self.tree.item(token, "values"))
+                values[0] = order_id
+                self.tree.insert("", self.tree.index(token), iid=str(order_id), values=values)
+            self.tree.delete(token)
+        for token in rejected:
+            if self.tree.exists(token):
+                self.tree.delete(token)
+        self.update_pending_label(remaining)
+        if rejected:
+            messagebox.showerror("Заказы не записаны", "\n\n".join(
+                f"{client}: {SERVICE.restore_error(error)}" for client, error in rejected.values()
+            ) + f"\n\nЗаказы сохранены в файл {os.path.basename(self.writer.failed_path)}")
+
+    def apply_changes(self, rows, deleted):
+        patch_tree(self.tree, rows, deleted, key=lambda values: str(values[4]), descending=True)
+
+    def selected_order_id(self, selected):
+        order_id = self.tree.item(selected[0])['values'][0]
+        if order_id == "":
+            messagebox.showerror("Ошибка", "Заказ еще не записан в базу, повторите через несколько секунд")
+            return None
+        return order_id
 
     def delete_order(self):
         selected = self.tree.selection()
@@ -143,10 +258,17 @@ class RestaurantApp:
             return
 
         if messagebox.askyesno("Подтверждение", "Удалить выбранный заказ?"):
-            order_id = self.tree.item(selected[0])['values'][0]
-            self.cursor.execute("DELETE FROM restaurant_data WHERE id = %s", (order_id,))
-            self.db.commit()
-            self.refresh_orders()
+            order_id = self.selected_order_id(selected)
+            if order_id is None:
+                return
+
+            def done(deleted):
+                self.refresh_orders()
+                # Заказы архива (включая перенесенные в архив после загрузки таблицы) не удаляются
+                if not deleted:
+                    messagebox.showerror("Ошибка", "Заказ находится в архиве или уже удален, удаление невозможно")
+
+            self.executor.submit(SERVICE.bind("delete_order", order_id), done)
 
     def change_status(self):
         selected = self.tree.selection()
@@ -154,10 +276,16 @@ class RestaurantApp:
             messagebox.showerror("Ошибка", "Выберите заказ!")
             return
 
-        order_id = self.tree.item(selected[0])['values'][0]
-        self.cursor.execute("UPDATE restaurant_data SET status = 'Выполнен' WHERE id = %s", (order_id,))
-        self.db.commit()
-        self.refresh_orders()
+        order_id = self.selected_order_id(selected)
+        if order_id is None:
+            return
+
+        def done(completed):
+            self.refresh_orders()
+            if not completed:
+                messagebox.showerror("Ошибка", "Заказ уже выполнен или находится в архиве, статус не изменен")
+
+        self.executor.submit(SERVICE.bind("complete_order", order_id), done)
 
     def generate_report(self, period):
         if self.current_role != "admin":
@@ -165,48 +293,147 @@ class RestaurantApp:
             return
 
         now = datetime.now()
-        if period == "day":
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            title = f"Отчет за {now.strftime('%d.%m.%Y')}"
-        elif period == "month":
-            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            title = f"Отчет за {now.strftime('%m.%Y')}"
-        else:  # year
-            start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-            title = f"Отчет за {now.year} год"
-
-        self.cursor.execute("""
-            SELECT SUM(order_total), COUNT(*) 
-            FROM restaurant_data 
-            WHERE order_date >= %s AND order_date <= %s
-        """, (start_date, now))
-
-        total_sum, total_orders = self.cursor.fetchone()
-
-        if not total_sum:
-            total_sum = 0
-            total_orders = 0
-
-        report_path = f"report_{period}_{now.strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write(f"{title}\n")
-            f.write("-" * 40 + "\n")
-            f.write(f"Количество заказов: {total_orders}\n")
-            f.write(f"Общая выручка: {total_sum:.2f} руб.\n")
-            f.write(f"Дата формирования: {now.strftime('%d.%m.%Y %H:%M:%S')}\n")
-
-        messagebox.showinfo("Успех", f"Отчет сохранен в файл: {report_path}")
+        _, title = report_period(period, now)
 
-    def refresh_orders(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        def done(totals):
+            total_sum, total_orders, hits, misses = totals
 
-        self.cursor.execute("SELECT * FROM restaurant_data ORDER BY order_date DESC")
-        for row in self.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+            if not total_sum:
+                total_sum = 0
+                total_orders = 0
 
+            report_path = f"report_{period}_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(f"{title}\n")
+                f.write("-" * 40 + "\n")
+                f.write(f"Количество заказов: {total_orders}\n")
+                f.write(f"Общая выручка: {total_sum:.2f} руб.\n")
+                f.write(f"Дата формирования: {now.strftime('%d.%m.%Y %H:%M:%S')}\n")
+                f.write(f"Кэш отчетов: попаданий {hits}, промахов {misses}\n")
+
+            messagebox.showinfo("Успех", f"Отчет сохранен в файл: {report_path}")
+
+        self.executor.submit(SERVICE.bind("fetch_report_totals", period, now), done, key="report-totals")
+
+    def generate_summary(self):
+        if self.current_role != "admin":
+            messagebox.showerror("Ошибка", "Только администратор может генерировать отчеты!")
+            return
+
+        now = datetime.now()
+
+        def done(summary):
+            report_path = f"summary_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+            write_summary_report(summary, report_path, now)
+            messagebox.showinfo("Успех", f"Отчет сохранен в файл: {report_path}")
+
+        self.executor.submit(SERVICE.bind("fetch_summary", now), done, key="report-summary")
+
+    def export_orders(self, period="year"):
+        if self.current_role != "admin":
+            messagebox.showerror("Ошибка", "Только администратор может выгружать заказы!")
+            return
+
+        if isinstance(self.executor.database, ServiceClient):
+            # Потоковая выгрузка идет напрямую из базы, через сервер она не передается
+            messagebox.showerror("Ошибка", "Выгрузка в CSV доступна только при прямом подключении к базе!")
+            return
+
+        path = filedialog.asksaveasfilename(title="Выгрузка заказов", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("Все файлы", "*.*")])
+        if not path:
+            return
+
+        now = datetime.now()
+        start_date, _ = report_period(period, now)
+
+        def done(exported):
+            messagebox.showinfo("Успех", f"Выгружено заказов: {exported}\nФайл: {path}")
+
+        self.executor.submit(lambda db: export_orders_csv(db, path, start_date, now), done, key="export")
+
+    def generate_dish_report(self, period="month"):
+        if self.current_role != "admin":
+            messagebox.showerror("Ошибка", "Только администратор может генерировать отчеты!")
+            return
+
+        now = datetime.now()
+        start_date, title = report_period(period, now)
+
+        def done(rows):
+            report_path = f"dishes_{period}_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(f"Продажи блюд. {title}\n")
+                f.write("-" * 40 + "\n")
+                for name, quantity, orders in rows:
+                    f.write(f"{name}: {quantity} порц. в {orders} заказах\n")
+                f.write(f"Дата формирования: {now.strftime('%d.%m.%Y %H:%M:%S')}\n")
+
+            messagebox.showinfo("Успех", f"Отчет сохранен в файл: {report_path}")
+
+        self.executor.submit(SERVICE.bind("fetch_dish_sales", start_date, now), done, key="report-dishes")
+
+    def refresh_orders(self):
+        def done(rows):
+            self.tree.delete(*self.tree.get_children())
+            for row in rows:
+                self.tree.insert("", "end", iid=str(row[0]), values=row)
+            # Заказы, еще не записанные в базу, остаются в таблице
+            pending = self.writer.snapshot()
+            for record in pending:
+                self.show_pending(record)
+            self.update_pending_label(len(pending))
+
+        # Повторные обновления подряд склеиваются в один запрос
+        include_archive = self.show_archive.get()
+        self.executor.submit(SERVICE.bind("fetch_orders", include_archive), done, key="refresh")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Система управления рестораном")
+    parser.add_argument("--rebuild-rollup", action="store_true",
+                        help="пересчитать дневные итоги выручки по всем заказам и выйти")
+    parser.add_argument("--export-csv", metavar="CSV", dest="export_path",
+                        help="выгрузить заказы периода в CSV и выйти")
+    parser.add_argument("--period", choices=("day", "month", "year"), default="year",
+                        help="период выгрузки (по умолчанию год)")
+    parser.add_argument("--archive", action="store_true",
+                        help="перенести заказы закрытых месяцев в архив и выйти")
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS,
+                        help=f"сколько прошедших месяцев оставлять в рабочей таблице (по умолчанию {ARCHIVE_KEEP_MONTHS})")
+    args = parser.parse_args()
+
+    if args.archive:
+        db = DATABASE.connect()
+        create_table(db)
+        before = months_before(datetime.now(), max(args.keep_months, 0))
+        moved = archive_orders(db, before)
+        print(f"Перенесено в архив заказов до {before.strftime('%d.%m.%Y')}: {moved}")
+        db.close()
+        return
+
+    if args.export_path:
+        db = DATABASE.connect()
+        create_table(db)
+        now = datetime.now()
+        start_date, _ = report_period(args.period, now)
+        exported = export_orders_csv(db, args.export_path, start_date, now)
+        print(f"Выгружено заказов: {exported}")
+        db.close()
+        return
+
+    if args.rebuild_rollup:
+        db = DATABASE.connect()
+        create_table(db)
+        rebuild_rollup(db)
+        print("Дневные итоги выручки пересчитаны")
+        db.close()
+        return
 
-if __name__ == "__main__":
     root = tk.Tk()
     app = RestaurantApp(root)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+from migrations import run_migrations, add_column, add_index
+from db import Database, prepared
+from service import Service
+from changes import add_change_tracking, fetch_changed_rows, prune_tombstones
+from datetime import timedelta
+import csv
+import re
+import threading
+
+# Позиция заказа: "Пицца x2", "Пицца ×2" или "2 Пицца"; без количества - одна порция
+ITEM_SUFFIX_QUANTITY = re.compile(r"^(.*?)\s*[xх×*]\s*(\d+)$", re.IGNORECASE)
+ITEM_PREFIX_QUANTITY = re.compile(r"^(\d+)\s*[xх×*]?\s+(.+)$", re.IGNORECASE)
+# Разбор старых заказов при миграции выполняется пачками
+ITEMS_BACKFILL_BATCH = 1000
+
+# Периоды сводного отчета и их названия
+SUMMARY_PERIODS = (("day", "Сегодня"), ("month", "Текущий месяц"), ("year", "Текущий год"))
+# Столбцы выгрузки заказов в CSV
+EXPORT_COLUMNS = ("id", "client_name", "menu_items", "order_total", "order_date", "status")
+# Столбцы таблицы заказов в интерфейсе
+ORDER_COLUMNS = ", ".join(EXPORT_COLUMNS)
+
+# Заказы закрытых месяцев старше этого числа месяцев переносятся в архив (--archive)
+ARCHIVE_KEEP_MONTHS = 3
+ARCHIVE_BATCH_SIZE = 1000
+
+# Дневные итоги выручки пересчитываются целиком этими запросами (миграция и --rebuild-rollup)
+ROLLUP_REBUILD = [
+    "DELETE FROM daily_revenue",
+    """
+        INSERT INTO daily_revenue (day, status, orders, revenue)
+        SELECT DATE(order_date), COALESCE(status, ''), COUNT(*), COALESCE(SUM(order_total), 0)
+        FROM restaurant_data
+        WHERE order_date IS NOT NULL
+        GROUP BY DATE(order_date), COALESCE(status, '')
+    """,
+]
+
+
+def parse_menu_items(text):
+    # Текст заказа "через запятую" -> {название блюда: количество}
+    items = {}
+    spelling = {}
+    for part in (text or "").split(","):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        quantity = 1
+        match = ITEM_SUFFIX_QUANTITY.match(part) or ITEM_PREFIX_QUANTITY.match(part)
+        if match:
+            if match.re is ITEM_SUFFIX_QUANTITY:
+                part, quantity = match.group(1), int(match.group(2))
+            else:
+                quantity, part = int(match.group(1)), match.group(2)
+        name = part[:100]
+        if name and quantity > 0:
+            # "Пицца" и "пицца" - одно блюдо, сохраняется первое написание
+            name = spelling.setdefault(name.lower(), name)
+            items[name] = items.get(name, 0) + quantity
+    return items
+
+
+def resolve_menu_ids(cursor, names):
+    cursor.executemany("INSERT IGNORE INTO menu (name) VALUES (%s)", [(name,) for name in names])
+    # Каждое название ищется сравнением самой базы (collation столбца) - тем же, по которому INSERT IGNORE
+    # счел его повтором (в MySQL - без учета регистра, а в MySQL 8 и без учета ударений и е/ё)
+    ids = {}
+    for name in names:
+        cursor.execute("SELECT id FROM menu WHERE name = %s", (name,))
+        ids[name] = cursor.fetchone()[0]
+    return ids
+
+
+def insert_order_items(cursor, orders):
+    # orders - список (id заказа, дата заказа, текст заказа)
+    parsed = [(order_id, order_date, parse_menu_items(text)) for order_id, order_date, text in orders]
+    names = sorted({name for _, _, items in parsed for name in items})
+    if not names:
+        return
+    menu_ids = resolve_menu_ids(cursor, names)
+    cursor.executemany(
+        "INSERT INTO order_items (order_id, menu_id, quantity, order_date) VALUES (%s, %s, %s, %s)",
+        [(order_id, menu_ids[name], quantity, order_date)
+         for order_id, order_date, items in parsed for name, quantity in items.items()]
+    )
+
+
+def create_order_items(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS menu (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            UNIQUE KEY uq_menu_name (name)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            menu_id INT NOT NULL,
+            quantity INT NOT NULL,
+            order_date DATETIME,
+            KEY idx_order_items_order (order_id),
+            KEY idx_order_items_date (order_date, menu_id, quantity, order_id)
+        )
+    """)
+
+    # Разбор уже существующих заказов; продолжает с места остановки, если миграция прерывалась
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM order_items")
+    last_id = cursor.fetchone()[0]
+    while True:
+        cursor.execute("""
+            SELECT id, order_date, menu_items FROM restaurant_data
+            WHERE id > %s ORDER BY id LIMIT %s
+        """, (last_id, ITEMS_BACKFILL_BATCH))
+        orders = cursor.fetchall()
+        if not orders:
+            break
+        insert_order_items(cursor, orders)
+        last_id = orders[-1][0]
+
+
+def track_order_changes(cursor):
+    add_change_tracking(cursor, "restaurant_data")
+    # Перенос в архив копирует строки целиком (SELECT *), столбцы таблиц должны совпадать
+    add_column(cursor, "restaurant_archive", "updated_at", "DATETIME")
+
+
+def add_client_token(cursor):
+    # По ключу повторная запись заказа из файла режима час пик не создает дубликат
+    add_column(cursor, "restaurant_data", "client_token", "CHAR(32) NULL")
+    add_index(cursor, "restaurant_data", "uq_client_token", "client_token", unique=True)
+
+
+MIGRATIONS = [
+    (1, "Таблица заказов", ["""
+        CREATE TABLE IF NOT EXISTS restaurant_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            client_name VARCHAR(100),
+            menu_items TEXT,
+            order_total DECIMAL(10, 2),
+            order_date DATETIME,
+            status VARCHAR(20)
+        )
+    """]),
+    (2, "Индекс по дате заказа", lambda cursor: add_index(cursor, "restaurant_data", "idx_order_date", "order_date")),
+    (3, "Дневные итоги выручки", ["""
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            day DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            orders INT NOT NULL,
+            revenue DECIMAL(14, 2) NOT NULL,
+            PRIMARY KEY (day, status)
+        )
+    """] + ROLLUP_REBUILD),
+    (4, "Справочник блюд и позиции заказов", create_order_items),
+    (5, "Кэш итогов закрытых периодов", ["""
+        CREATE TABLE IF NOT EXISTS report_cache (
+            period VARCHAR(10) NOT NULL,
+            period_start DATE NOT NULL,
+            orders INT NOT NULL,
+            revenue DECIMAL(14, 2) NOT NULL,
+            PRIMARY KEY (period, period_start)
+        )
+    """]),
+    (6, "Ключ заказа для повторной записи из режима час пик", add_client_token),
+    (7, "Архив заказов закрытых месяцев", [
+        "CREATE TABLE IF NOT EXISTS restaurant_archive LIKE restaurant_data",
+        "ALTER TABLE restaurant_archive ROW_FORMAT=COMPRESSED",
+    ]),
+    (8, "Время изменения и удаленные заказы для синхронизации терминалов", track_order_changes),
+]
+
+
+DATABASE = Database("restaurant_db")
+
+
+def create_table(db):
+    run_migrations(db, MIGRATIONS)
+    prune_tombstones(db)
+
+
+def execute(db, query, values, commit=True):
+    prepared(db, query).execute(query, values)
+    if commit:
+        db.commit()
+
+
+def order_tables(db, start_date):
+    # Рабочая таблица и, если период начинается не позже последнего архивного заказа, архив; новые - первыми
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT MAX(order_date) FROM restaurant_archive")
+        boundary = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if boundary is not None and (start_date is None or start_date <= boundary):
+        return ["restaurant_data", "restaurant_archive"]
+    return ["restaurant_data"]
+
+
+def fetch_orders(db, include_archive=False):
+    # По умолчанию читаются только заказы рабочей таблицы, архив - по запросу
+    tables = ["restaurant_data", "restaurant_archive"] if include_archive else ["restaurant_data"]
+    cursor = db.cursor()
+    try:
+        rows = []
+        for table in tables:
+            cursor.execute(f"SELECT {ORDER_COLUMNS} FROM {table} ORDER BY order_date DESC")
+            rows.extend(cursor.fetchall())
+        return rows
+    finally:
+        cursor.close()
+
+
+def fetch_changes(db, since, include_archive=False):
+    # Заказы, измененные с since, и удаленные заказы; перенесенные в архив удалены, только если архив не показан
+    return fetch_changed_rows(db, "restaurant_data", ORDER_COLUMNS, since,
+                              kept_in="restaurant_archive" if include_archive else None)
+
+
+def months_before(day, months):
+    # Первое число месяца, отстоящего от day на months месяцев назад
+    index = day.year * 12 + day.month - 1 - months
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_orders(db, before, batch_size=ARCHIVE_BATCH_SIZE):
+    # Перенос заказов с датой раньше before в архив; каждая пачка - отдельная транзакция.
+    # Дневные итоги, кэш отчетов и позиции заказов не меняются: заказы остаются учтенными
+    moved = 0
+    cursor = db.cursor()
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id FROM restaurant_data
+                WHERE order_date < %s
+                ORDER BY id LIMIT %s
+                FOR UPDATE
+            """, (before, batch_size))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            placeholders = ", ".join(["%s"] * len(ids))
+            # Архив создан через LIKE; новые столбцы restaurant_data нужно добавлять и в него
+            cursor.execute(f"INSERT INTO restaurant_archive SELECT * FROM restaurant_data WHERE id IN ({placeholders})",
+                           ids)
+            cursor.execute(f"DELETE FROM restaurant_data WHERE id IN ({placeholders})", ids)
+            db.commit()
+            moved += len(ids)
+    finally:
+        cursor.close()
+    return moved
+
+
+def period_end(period, start):
+    # Первый день следующего периода
+    if period == "day":
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class ReportCache:
+    # Итоги прошедших дней и месяцев хранятся в report_cache; пересчитывается только текущий период
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def closed_totals(self, db, period, first, last):
+        # Сумма заказов и выручки по закрытым периодам, начинающимся в [first, last)
+        starts = []
+        start = first
+        while start < last:
+            starts.append(start)
+            start = period_end(period, start)
+        if not starts:
+            return 0, 0
+
+        cursor = db.cursor()
+        try:
+            cursor.execute("""
+                SELECT period_start, orders, revenue FROM report_cache
+                WHERE period = %s AND period_start >= %s AND period_start < %s
+            """, (period, first, last))
+            totals = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+            missing = [start for start in starts if start not in totals]
+
+            if missing:
+                # Разделяемая блокировка итогов: параллельное изменение заказа дождется записи в кэш
+                # и удалит ее при инвалидации, поэтому устаревшее значение в кэше не останется
+                group = "day" if period == "day" else "DATE_SUB(day, INTERVAL DAYOFMONTH(day) - 1 DAY)"
+                cursor.execute(f"""
+                    SELECT {group}, SUM(orders), SUM(revenue) FROM daily_revenue
+                    WHERE day >= %s AND day < %s
+                    GROUP BY 1
+                    LOCK IN SHARE MODE
+                """, (missing[0], period_end(period, missing[-1])))
+                computed = {start: (0, 0) for start in missing}
+                for start, orders, revenue in cursor.fetchall():
+                    if start in computed:
+                        computed[start] = (int(orders), revenue)
+                cursor.executemany(
+                    "INSERT IGNORE INTO report_cache (period, period_start, orders, revenue) VALUES (%s, %s, %s, %s)",
+                    [(period, start, orders, revenue) for start, (orders, revenue) in computed.items()]
+                )
+                totals.update(computed)
+            db.commit()
+        finally:
+            cursor.close()
+
+        with self.lock:
+            self.hits += len(starts) - len(missing)
+            self.misses += len(missing)
+        return sum(totals[start][0] for start in starts), sum(totals[start][1] for start in starts)
+
+
+REPORT_CACHE = ReportCache()
+
+
+def invalidate_report_cache(db, day):
+    query = """
+        DELETE FROM report_cache
+        WHERE (period = 'day' AND period_start = %s) OR (period = 'month' AND period_start = %s)
+    """
+    prepared(db, query).execute(query, (day, day.replace(day=1)))
+
+
+def adjust_rollup(db, order_date, status, orders, revenue):
+    # Изменение дневного итога в той же транзакции, что и изменение заказа
+    if order_date is None:
+        return
+    query = """
+        INSERT INTO daily_revenue (day, status, orders, revenue) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE orders = orders + VALUES(orders), revenue = revenue + VALUES(revenue)
+    """
+    prepared(db, query).execute(query, (order_date.date(), status or "", orders, revenue))
+    # Кэш строится по дневным итогам, поэтому сбрасываются ровно день и месяц измененного заказа
+    invalidate_report_cache(db, order_date.date())
+
+
+def write_orders(db, orders):
+    # orders - список (ключ, клиент, заказ, сумма, дата, статус); все пишутся одной транзакцией.
+    # Заказ с уже записанным ключом пропускается, для него возвращается None
+    query = """
+        INSERT INTO restaurant_data (client_token, client_name, menu_items, order_total, order_date, status)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = id
+    """
+    cursor = prepared(db, query)
+    order_ids = []
+    written = []
+    rollup = {}
+    for token, client, items, total, order_date, status in orders:
+        cursor.execute(query, (token, client, items, total, order_date, status))
+        if cursor.rowcount != 1:
+            order_ids.append(None)
+            continue
+        order_ids.append(cursor.lastrowid)
+        written.append((cursor.lastrowid, order_date, items))
+        if order_date is not None:
+            key = (order_date.date(), status)
+            count, revenue, _ = rollup.get(key, (0, 0, order_date))
+            rollup[key] = (count + 1, revenue + total, order_date)
+
+    items_cursor = db.cursor()
+    try:
+        insert_order_items(items_cursor, written)
+    finally:
+        items_cursor.close()
+
+    # Итоги пачки сводятся к одному изменению на день и статус
+    for (_, status), (count, revenue, order_date) in rollup.items():
+        adjust_rollup(db, order_date, status, count, revenue)
+    db.commit()
+    return order_ids
+
+
+def insert_order(db, client, items, total, order_date, status):
+    return write_orders(db, [(None, client, items, total, order_date, status)])[0]
+
+
+def lock_order(db, order_id):
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT order_date, status, order_total FROM restaurant_data WHERE id = %s FOR UPDATE",
+                       (order_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def delete_order(db, order_id):
+    order = lock_order(db, order_id)
+    if order is None:
+        db.rollback()
+        return False
+    execute(db, "DELETE FROM restaurant_data WHERE id = %s", (order_id,), commit=False)
+    execute(db, "DELETE FROM order_items WHERE order_id = %s", (order_id,), commit=False)
+    adjust_rollup(db, order[0], order[1], -1, -(order[2] or 0))
+    db.commit()
+    return True
+
+
+def complete_order(db, order_id, status="Выполнен"):
+    order = lock_order(db, order_id)
+    if order is None or order[1] == status:
+        db.rollback()
+        return False
+    execute(db, "UPDATE restaurant_data SET status = %s WHERE id = %s", (status, order_id), commit=False)
+    adjust_rollup(db, order[0], order[1], -1, -(order[2] or 0))
+    adjust_rollup(db, order[0], status, 1, order[2] or 0)
+    db.commit()
+    return True
+
+
+def rebuild_rollup(db):
+    cursor = db.cursor()
+    try:
+        cursor.execute("DELETE FROM daily_revenue")
+        # Итоги считаются и по архивным заказам
+        cursor.execute("""
+            INSERT INTO daily_revenue (day, status, orders, revenue)
+            SELECT DATE(order_date), COALESCE(status, ''), COUNT(*), COALESCE(SUM(order_total), 0)
+            FROM (
+                SELECT order_date, status, order_total FROM restaurant_data
+                UNION ALL
+                SELECT order_date, status, order_total FROM restaurant_archive
+            ) orders
+            WHERE order_date IS NOT NULL
+            GROUP BY DATE(order_date), COALESCE(status, '')
+        """)
+        cursor.execute("DELETE FROM report_cache")
+        db.commit()
+    finally:
+        cursor.close()
+
+
+def fetch_totals(db, start_date, end_date):
+    # Отчет читает не больше одной строки итогов на день и статус вместо всех заказов периода
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT SUM(revenue), SUM(orders)
+            FROM daily_revenue
+            WHERE day >= %s AND day <= %s
+        """, (start_date.date(), end_date.date()))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def fetch_report_totals(db, period, now):
+    # Закрытые месяцы и дни берутся из кэша, заново считается только сегодняшний день
+    today = now.date()
+    month_start = today.replace(day=1)
+    orders, revenue = 0, 0
+    if period == "year":
+        closed = REPORT_CACHE.closed_totals(db, "month", month_start.replace(month=1), month_start)
+        orders, revenue = orders + closed[0], revenue + closed[1]
+    if period in ("month", "year"):
+        closed = REPORT_CACHE.closed_totals(db, "day", month_start, today)
+        orders, revenue = orders + closed[0], revenue + closed[1]
+
+    day_revenue, day_orders = fetch_totals(db, now.replace(hour=0, minute=0, second=0, microsecond=0), now)
+    # Счетчики кэша возвращаются вместе с итогами: при работе через сервер кэш находится там
+    return revenue + (day_revenue or 0), orders + (day_orders or 0), REPORT_CACHE.hits, REPORT_CACHE.misses
+
+
+def fetch_dish_sales(db, start_date, end_date):
+    # Группировка по индексу (order_date, menu_id, quantity, order_id) без чтения самих заказов
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT m.name, s.quantity, s.orders FROM (
+                SELECT menu_id, SUM(quantity) AS quantity, COUNT(DISTINCT order_id) AS orders
+                FROM order_items
+                WHERE order_date >= %s AND order_date <= %s
+                GROUP BY menu_id
+            ) s
+            JOIN menu m ON m.id = s.menu_id
+            ORDER BY s.quantity DESC
+        """, (start_date, end_date))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def fetch_period_summary(db, now):
+    # Один проход по индексу order_date за год: заказы и выручка по дню, часу и статусу
+    year_start, _ = report_period("year", now)
+    cursor = db.cursor()
+    try:
+        rows = []
+        # Строки архива и рабочей таблицы просто складываются в summarize_periods
+        for table in order_tables(db, year_start):
+            cursor.execute(f"""
+                SELECT DATE(order_date), HOUR(order_date), COALESCE(status, ''), COUNT(*), COALESCE(SUM(order_total), 0)
+                FROM {table}
+                WHERE order_date >= %s AND order_date <= %s
+                GROUP BY DATE(order_date), HOUR(order_date), COALESCE(status, '')
+            """, (year_start, now))
+            rows.extend(cursor.fetchall())
+        return rows
+    finally:
+        cursor.close()
+
+
+def summarize_periods(rows, now):
+    # Сгруппированные строки раскладываются по всем периодам сразу, без повторных запросов
+    starts = {period: report_period(period, now)[0].date() for period, _ in SUMMARY_PERIODS}
+    summary = {
+        period: {"orders": 0, "revenue": 0, "statuses": {}, "hours": [[0, 0] for _ in range(24)]}
+        for period, _ in SUMMARY_PERIODS
+    }
+    for day, hour, status, orders, revenue in rows:
+        for period, start in starts.items():
+            if day < start:
+                continue
+            totals = summary[period]
+            totals["orders"] += orders
+            totals["revenue"] += revenue
+            by_status = totals["statuses"].setdefault(status or "Без статуса", [0, 0])
+            by_status[0] += orders
+            by_status[1] += revenue
+            totals["hours"][hour][0] += orders
+            totals["hours"][hour][1] += revenue
+    return summary
+
+
+def write_summary_report(summary, report_path, now):
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f"Сводный отчет на {now.strftime('%d.%m.%Y %H:%M')}\n")
+        for period, name in SUMMARY_PERIODS:
+            totals = summary[period]
+            f.write("\n" + "=" * 40 + "\n")
+            f.write(f"{name}: {totals['orders']} заказов, выручка {totals['revenue']:.2f} руб.\n")
+            if not totals["orders"]:
+                continue
+
+            f.write("\nПо статусам:\n")
+            for status, (orders, revenue) in sorted(totals["statuses"].items(), key=lambda item: -item[1][1]):
+                f.write(f"  {status}: {orders} заказов, {revenue:.2f} руб.\n")
+
+            f.write("\nПо часам:\n")
+            for hour, (orders, revenue) in enumerate(totals["hours"]):
+                if orders:
+                    f.write(f"  {hour:02d}:00-{hour:02d}:59: {orders} заказов, {revenue:.2f} руб.\n")
+        f.write(f"\nДата формирования: {now.strftime('%d.%m.%Y %H:%M:%S')}\n")
+
+
+def fetch_summary(db, now):
+    return summarize_periods(fetch_period_summary(db, now), now)
+
+
+def export_orders_csv(db, path, start_date, end_date):
+    # Архивные заказы старше рабочих, поэтому таблицы читаются от архива к рабочей
+    tables = reversed(order_tables(db, start_date))
+    # Небуферизованный курсор: строки читаются с сервера по мере записи, память не растет с периодом
+    cursor = db.cursor(buffered=False)
+    exported = 0
+    try:
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(EXPORT_COLUMNS)
+            for table in tables:
+                cursor.execute(f"""
+                    SELECT {', '.join(EXPORT_COLUMNS)} FROM {table}
+                    WHERE order_date >= %s AND order_date <= %s
+                    ORDER BY order_date
+                """, (start_date, end_date))
+                for row in cursor:
+                    writer.writerow(row)
+                    exported += 1
+    finally:
+        cursor.close()
+    return exported
+
+
+def report_period(period, now):
+    if period == "day":
+        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        title = f"Отчет за {now.strftime('%d.%m.%Y')}"
+    elif period == "month":
+        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        title = f"Отчет за {now.strftime('%m.%Y')}"
+    else:  # year
+        start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        title = f"Отчет за {now.year} год"
+    return start_date, title
+
+
+# Операции, которые интерфейс вызывает через SERVICE.bind - локально или на сервере
+SERVICE = Service("restaurant", DATABASE, [
+    create_table,
+    fetch_orders,
+    fetch_changes,
+    write_orders,
+    insert_order,
+    delete_order,
+    complete_order,
+    fetch_report_totals,
+    fetch_dish_sales,
+    fetch_summary,
+], idempotent=[write_orders])
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import concurrent.futures
+import hmac
+import ipaddress
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from service import encode, decode, error_payload, load_service_token
+import metrics
+import warehouse_service
+import transport_service
+import restaurant_service
+
+SERVICES = {service.name: service for service in (
+    warehouse_service.SERVICE,
+    transport_service.SERVICE,
+    restaurant_service.SERVICE,
+)}
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# Операции выполняются в ограниченном числе потоков: соединений с каждой базой не больше, чем потоков
+DEFAULT_WORKERS = 5
+# Простаивающее соединение терминала закрывается через это время, с
+KEEPALIVE_TIMEOUT = 60
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").strip().split(" ")
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Некорректная строка запроса")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Некорректный Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Слишком большой запрос")
+    body = await reader.readexactly(length) if length else b""
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    return method, urlsplit(target).path, headers, body, keep_alive
+
+
+def write_response(writer, status, payload, keep_alive):
+    data = encode(payload)
+    status = HTTPStatus(status)
+    writer.write((
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode("latin-1") + data)
+
+
+class ServiceServer:
+    # Один процесс обслуживает все терминалы: соединения держит asyncio, запросы к базе - пул потоков
+    def __init__(self, services, workers=DEFAULT_WORKERS, token=None):
+        self.services = services
+        # Общий ключ терминалов (token в разделе [service] db.ini); без ключа сервер слушает только этот компьютер
+        self.token = token
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+
+    def execute(self, service, operation, args):
+        # Выполняется в потоке пула; у потока свое соединение из пула Database
+        try:
+            return service.call(service.database.connect(), operation, args)
+        except Exception:
+            try:
+                service.database.connect().rollback()
+            except Exception:
+                service.database.discard()
+            raise
+
+    def authorized(self, headers):
+        if not self.token:
+            return True
+        return hmac.compare_digest(headers.get("authorization", "").encode("utf-8"),
+                                   f"Bearer {self.token}".encode("utf-8"))
+
+    async def dispatch(self, method, path, headers, body):
+        if path == "/health":
+            return HTTPStatus.OK, {"result": {"status": "ok", "services": sorted(self.services)}}
+        if not self.authorized(headers):
+            return HTTPStatus.UNAUTHORIZED, {"error": {"type": "Unauthorized",
+                                                       "message": "Неверный ключ доступа к серверу (token в db.ini)"}}
+
+        parts = path.strip("/").split("/")
+        service = self.services.get(parts[0]) if len(parts) == 2 else None
+        if service is None or parts[1] not in service.operations:
+            return HTTPStatus.NOT_FOUND, {"error": {"type": "NotFound", "message": f"Нет операции {path}"}}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": {"type": "MethodNotAllowed",
+                                                             "message": "Операции вызываются методом POST"}}
+
+        try:
+            args = decode(body).get("args", []) if body else []
+        except (ValueError, AttributeError):
+            return HTTPStatus.BAD_REQUEST, {"error": {"type": "BadRequest", "message": "Некорректный JSON"}}
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.pool, self.execute, service, parts[1], args)
+        except Exception as e:
+            # Ожидаемые ошибки (конфликт версий и т.п.) - 409, остальные - 500
+            status = HTTPStatus.CONFLICT if service.is_expected(e) else HTTPStatus.INTERNAL_SERVER_ERROR
+            return status, {"error": error_payload(e)}
+        return HTTPStatus.OK, {"result": result}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    write_response(writer, e.status, {"error": {"type": "BadRequest", "message": str(e)}}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body, keep_alive = request
+                status, payload = await self.dispatch(method, path, headers, body)
+                try:
+                    write_response(writer, status, payload, keep_alive)
+                except (TypeError, ValueError) as e:
+                    write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR,
+                                   {"error": {"type": "ServiceError", "message": str(e)}}, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def migrate(self):
+        loop = asyncio.get_running_loop()
+        for service in self.services.values():
+            try:
+                await loop.run_in_executor(self.pool, self.execute, service, "create_table", [])
+            except Exception as e:
+                print(f"Не удалось подготовить базу {service.database.name}: {str(e)}")
+
+    async def serve(self, host, port):
+        await self.migrate()
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Сервер запущен: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def is_local(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер операций склада, транспорта и ресторана")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"адрес для входящих соединений (по умолчанию {DEFAULT_HOST}, "
+                             "для терминалов в сети - адрес этого компьютера в локальной сети)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"порт (по умолчанию {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="число потоков для запросов к базе; не больше pool_size из db.ini")
+    args = parser.parse_args()
+
+    token = load_service_token()
+    if not token and not is_local(args.host):
+        parser.error("для доступа из сети задайте token в разделе [service] db.ini (или APP_SERVICE_TOKEN)")
+
+    metrics.start("server")
+    try:
+        asyncio.run(ServiceServer(SERVICES, args.workers, token).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
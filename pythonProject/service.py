@@ -0,0 +1,213 @@
+import configparser
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import urlsplit
+from db import CONFIG_PATH, is_permanent_error
+
+# Адрес сервера операций (server.py): переменная окружения или раздел [service] в db.ini.
+# Если адрес не задан, программа работает с базой напрямую
+SERVICE_URL_VARIABLE = "APP_SERVICE_URL"
+# Общий ключ доступа к серверу: переменная окружения или token в разделе [service] db.ini
+SERVICE_TOKEN_VARIABLE = "APP_SERVICE_TOKEN"
+SERVICE_TIMEOUT = 60
+# Соединение, простоявшее дольше, заменяется новым: сервер закрывает простаивающее через 60 с
+SERVICE_IDLE_TIMEOUT = 50
+
+
+class ServiceError(Exception):
+    # Ошибка на сервере, тип которой не известен клиенту, или сервер недоступен
+    pass
+
+
+class ServiceUnavailable(ServiceError):
+    # Сервер недоступен или оборвал соединение - запрос стоит повторить
+    pass
+
+
+class ServiceRejected(ServiceError):
+    # Сервер отклонил запрос ошибкой, которая повторится (нарушение ключа, неверные данные)
+    pass
+
+
+def load_service_setting(option, variable):
+    if os.environ.get(variable):
+        return os.environ[variable]
+    parser = configparser.ConfigParser()
+    parser.read(CONFIG_PATH, encoding="utf-8")
+    return parser.get("service", option, fallback="").strip() or None
+
+
+def load_service_url():
+    return load_service_setting("url", SERVICE_URL_VARIABLE)
+
+
+def load_service_token():
+    return load_service_setting("token", SERVICE_TOKEN_VARIABLE)
+
+
+def encode_value(value):
+    # Типы значений из базы, которых нет в JSON, передаются с пометкой типа
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Значение типа {type(value).__name__} нельзя передать через сервис")
+
+
+def decode_value(value):
+    if len(value) == 1:
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if "$date" in value:
+            return date.fromisoformat(value["$date"])
+        if "$decimal" in value:
+            return Decimal(value["$decimal"])
+    return value
+
+
+def encode(value):
+    return json.dumps(value, default=encode_value, ensure_ascii=False).encode("utf-8")
+
+
+def decode(data):
+    return json.loads(data, object_hook=decode_value)
+
+
+def error_payload(error):
+    # Атрибуты исключения (например, StockConflict.quantity) передаются клиенту вместе с текстом
+    attributes = {}
+    for name, value in vars(error).items():
+        try:
+            encode(value)
+        except (TypeError, ValueError):
+            continue
+        attributes[name] = value
+    return {"type": type(error).__name__, "message": str(error), "attributes": attributes,
+            "permanent": is_permanent_error(error)}
+
+
+class Service:
+    # Операции одной базы без привязки к интерфейсу: выполняются напрямую или на сервере (server.py)
+    def __init__(self, name, database, operations, errors=(), idempotent=()):
+        self.name = name
+        self.database = database
+        self.operations = {operation.__name__: operation for operation in operations}
+        # Операции с ключом повтора (записи журналов): сервер не применит их дважды, поэтому после обрыва
+        # связи клиент отправляет их повторно. Остальные могли выполниться до обрыва и не повторяются
+        self.idempotent = {operation.__name__ for operation in idempotent}
+        # Исключения, которые клиент восстанавливает по имени типа, остальные приходят как ServiceError
+        self.errors = {error.__name__: error for error in errors}
+
+    def call(self, db, operation, args):
+        return self.operations[operation](db, *args)
+
+    def bind(self, operation, *args):
+        # Задание для QueryExecutor: fn(db), где db - соединение с базой или ServiceClient
+        if operation not in self.operations:
+            raise KeyError(f"Неизвестная операция {self.name}.{operation}")
+
+        def job(db):
+            if isinstance(db, ServiceClient):
+                return db.call(operation, *args)
+            return self.call(db, operation, args)
+        return job
+
+    def backend(self):
+        # То, что передается в QueryExecutor вместо Database: клиент сервера, если он настроен
+        url = load_service_url()
+        return ServiceClient(url, self) if url else self.database
+
+    def is_expected(self, error):
+        return type(error).__name__ in self.errors
+
+    def restore_error(self, payload):
+        error_class = self.errors.get(payload.get("type"))
+        if error_class is None:
+            error_class = ServiceRejected if payload.get("permanent") else ServiceError
+            return error_class(payload.get("message") or "Ошибка сервера")
+        # Исключение восстанавливается без вызова __init__, с текстом и атрибутами с сервера
+        error = error_class.__new__(error_class)
+        Exception.__init__(error, payload.get("message"))
+        error.__dict__.update(payload.get("attributes") or {})
+        return error
+
+
+class ServiceClient:
+    # Вызов операций на сервере. Для QueryExecutor заменяет Database: connect() возвращает сам клиент
+    def __init__(self, url, service):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.service = service
+        self.token = load_service_token()
+        # У каждого рабочего потока свое постоянное HTTP-соединение
+        self.local = threading.local()
+
+    def connect(self):
+        return self
+
+    def rollback(self):
+        # Транзакции ведет сервер, откатывать на клиенте нечего
+        pass
+
+    def discard(self):
+        connection = getattr(self.local, "connection", None)
+        self.local.connection = None
+        if connection is not None:
+            connection.close()
+
+    def call(self, operation, *args):
+        # http.client нужен только терминалам, работающим через сервер
+        import http.client
+
+        body = encode({"args": list(args)})
+        path = f"{self.prefix}/{self.service.name}/{operation}"
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        while True:
+            connection = getattr(self.local, "connection", None)
+            if connection is not None and time.monotonic() - self.local.used > SERVICE_IDLE_TIMEOUT:
+                self.discard()
+                connection = None
+            reused = connection is not None
+            if connection is None:
+                connection = self.local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                                timeout=SERVICE_TIMEOUT)
+            try:
+                connection.request("POST", path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                self.local.used = time.monotonic()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self.discard()
+                # Сервер закрыл соединение, которое простаивало: повтор по новому - только для операции
+                # с ключом повтора, иначе она могла выполниться до обрыва
+                if not reused or operation not in self.service.idempotent:
+                    raise ServiceUnavailable(f"Сервер недоступен: {str(e)}")
+            except (OSError, http.client.HTTPException) as e:
+                self.discard()
+                raise ServiceUnavailable(f"Сервер недоступен: {str(e)}")
+
+        try:
+            payload = decode(data)
+        except ValueError:
+            raise ServiceError(f"Некорректный ответ сервера (HTTP {response.status})")
+        if response.status == 401:
+            # Ключ в db.ini не задан или неверен: записи журналов ждут исправления настройки, а не отклоняются
+            raise ServiceUnavailable((payload.get("error") or {}).get("message") or "Сервер отклонил ключ доступа")
+        if response.status != 200:
+            raise self.service.restore_error(payload.get("error") or {})
+        return payload.get("result")
@@ -0,0 +1,270 @@
+import functools
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+# Ожидание записи другого потока или процесса, с
+BUSY_TIMEOUT = 30
+PRAGMAS = (
+    # WAL: чтение не ждет записи, запись не ждет чтения
+    "PRAGMA journal_mode = WAL",
+    # Фиксация без fsync на каждую транзакцию; при сбое питания теряются только последние транзакции
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+)
+
+CENTS = Decimal("0.01")
+
+# Значения передаются в SQLite строками ISO, как их возвращает MySQL
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+# Столбцы читаются по объявленному типу: SQLite хранит 500.00 в DECIMAL как целое 500
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()).quantize(CENTS))
+# Дата со временем, записанная в столбец DATE, читается как дата - MySQL так же отбрасывает время
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+DATE_VALUE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DATETIME_VALUE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$")
+INTERVAL = re.compile(r"^INTERVAL\s+(.+)\s+(SECOND|MINUTE|HOUR|DAY|MONTH|YEAR)$", re.IGNORECASE | re.DOTALL)
+CREATE_LIKE = re.compile(r"^\s*CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+LIKE\s+(\w+)\s*$", re.IGNORECASE)
+CREATE_TABLE = re.compile(r"^\s*(CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*)\((.*)\)\s*$",
+                          re.IGNORECASE | re.DOTALL)
+TABLE_KEY = re.compile(r"^(UNIQUE\s+)?(?:KEY|INDEX)\s+(\w+)\s*(\(.*\))$", re.IGNORECASE | re.DOTALL)
+LOCKING_READ = re.compile(r"\s+(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\s*$", re.IGNORECASE)
+READ_ONLY = ("SELECT", "PRAGMA", "WITH", "EXPLAIN")
+
+
+def split_top_level(text):
+    # Разбиение по запятым вне скобок
+    parts = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:index].strip())
+            start = index + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def replace_calls(sql, name, rewrite):
+    # Замена вызовов name(...) с вложенными скобками; rewrite получает список аргументов
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    result = []
+    position = 0
+    while True:
+        match = pattern.search(sql, position)
+        if not match:
+            break
+        depth = 1
+        index = match.end()
+        while depth:
+            if sql[index] == "(":
+                depth += 1
+            elif sql[index] == ")":
+                depth -= 1
+            index += 1
+        arguments = split_top_level(sql[match.end():index - 1])
+        result.append(sql[position:match.start()])
+        result.append(rewrite([replace_calls(argument, name, rewrite) for argument in arguments]))
+        position = index
+    result.append(sql[position:])
+    return "".join(result)
+
+
+def date_shift(arguments, sign):
+    # DATE_ADD(x, INTERVAL n DAY): дата остается датой, дата со временем - датой со временем
+    value, interval = arguments
+    amount, unit = INTERVAL.match(interval).groups()
+    modifier = f"{sign}({amount}) || ' {unit.lower()}s'"
+    if unit.upper() in ("SECOND", "MINUTE", "HOUR"):
+        return f"datetime({value}, {modifier})"
+    return f"CASE WHEN length({value}) > 10 THEN datetime({value}, {modifier}) ELSE date({value}, {modifier}) END"
+
+
+FUNCTIONS = (
+    ("NOW", lambda arguments: "datetime('now', 'localtime')"),
+    ("CURDATE", lambda arguments: "date('now', 'localtime')"),
+    ("HOUR", lambda arguments: f"CAST(strftime('%H', {arguments[0]}) AS INTEGER)"),
+    ("DAYOFMONTH", lambda arguments: f"CAST(strftime('%d', {arguments[0]}) AS INTEGER)"),
+    ("DATE_ADD", lambda arguments: date_shift(arguments, "")),
+    ("DATE_SUB", lambda arguments: date_shift(arguments, "-")),
+)
+
+
+def translate_upsert(sql):
+    head, update = re.split(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", sql, flags=re.IGNORECASE)
+    assignments = split_top_level(update)
+    # "id = id" - только пропуск дубликата; rowcount 0, как в MySQL
+    if all(left.strip() == right.strip() for left, _, right in (a.partition("=") for a in assignments)):
+        return f"{head} ON CONFLICT DO NOTHING"
+    update = replace_calls(update, "VALUES", lambda arguments: f"excluded.{arguments[0]}")
+    return f"{head} ON CONFLICT DO UPDATE SET {update}"
+
+
+def translate_create_table(sql):
+    # Индексы, объявленные в CREATE TABLE через KEY, в SQLite создаются отдельно
+    match = CREATE_TABLE.match(sql)
+    prefix, table, body = match.groups()
+    columns = []
+    indexes = []
+    for item in split_top_level(body):
+        key = TABLE_KEY.match(item)
+        if key is None:
+            columns.append(item)
+        elif key.group(1):
+            columns.append(f"UNIQUE {key.group(3)}")
+        else:
+            indexes.append(f"CREATE INDEX IF NOT EXISTS {key.group(2)} ON {table} {key.group(3)}")
+    return [f"{prefix}({', '.join(columns)})"] + indexes
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(query):
+    # Запрос на диалекте MySQL -> (операторы SQLite, нужны ли параметры, начинает ли транзакцию записи)
+    sql = query.strip()
+    if re.match(r"^ALTER\s+TABLE\s+\w+\s+ROW_FORMAT", sql, re.IGNORECASE):
+        return [], False, False
+
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"^INSERT\s+IGNORE\b", "INSERT OR IGNORE", sql, flags=re.IGNORECASE)
+    if re.search(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", sql, re.IGNORECASE):
+        sql = translate_upsert(sql)
+    locking = LOCKING_READ.search(sql) is not None
+    sql = LOCKING_READ.sub("", sql)
+    for name, rewrite in FUNCTIONS:
+        sql = replace_calls(sql, name, rewrite)
+    # В MySQL обратная косая черта экранирует % и _ в LIKE по умолчанию, в SQLite - только с ESCAPE
+    sql = re.sub(r"\bLIKE\s+\?", r"LIKE ? ESCAPE '\\'", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", sql,
+                 flags=re.IGNORECASE)
+
+    statements = translate_create_table(sql) if CREATE_TABLE.match(sql) else [sql]
+    writes = locking or sql.split(None, 1)[0].upper() not in READ_ONLY
+    return statements, "?" in statements[-1], writes
+
+
+def convert(value):
+    # Выражения (MAX, SUM, DATE(...)) объявленного типа не имеют, их результат приводится к типам MySQL:
+    # даты вместо строк, Decimal вместо float (дробные значения в схемах программ - только DECIMAL(..., 2))
+    if isinstance(value, float):
+        return Decimal(f"{value:.2f}")
+    if isinstance(value, str) and len(value) >= 10 and value[4] == "-":
+        if DATE_VALUE.match(value):
+            return date.fromisoformat(value)
+        if DATETIME_VALUE.match(value):
+            return datetime.fromisoformat(value)
+    return value
+
+
+def convert_row(row):
+    return None if row is None else tuple(convert(value) for value in row)
+
+
+class SQLiteCursor:
+    # Курсор с интерфейсом курсора mysql.connector: запросы переводятся на диалект SQLite
+    dialect = "sqlite"
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.connection.cursor()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, query, params=()):
+        like = CREATE_LIKE.match(query)
+        if like:
+            self.connection.begin()
+            self.copy_table(*like.groups())
+            return
+        statements, with_params, writes = translate(query)
+        if writes:
+            self.connection.begin()
+        for statement in statements[:-1]:
+            self.cursor.execute(statement)
+        if statements:
+            self.cursor.execute(statements[-1], tuple(params or ()) if with_params else ())
+
+    def executemany(self, query, seq_params):
+        statements, _, writes = translate(query)
+        if writes:
+            self.connection.begin()
+        self.cursor.executemany(statements[-1], [tuple(params) for params in seq_params])
+
+    def copy_table(self, table, source):
+        # CREATE TABLE ... LIKE: та же схема и те же индексы под именами с префиксом новой таблицы
+        self.cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if self.cursor.fetchone()[0]:
+            return
+        # Триггеры не копируются, как и в MySQL
+        self.cursor.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                            "AND type IN ('table', 'index') ORDER BY type = 'index'", (source,))
+        for kind, name, sql in self.cursor.fetchall():
+            if kind == "table":
+                sql = re.sub(rf"^CREATE TABLE\s+(\"?){source}\1", f"CREATE TABLE {table}", sql)
+            else:
+                sql = re.sub(rf"^CREATE (UNIQUE )?INDEX\s+(\"?){name}\2\s+ON\s+(\"?){source}\3",
+                             rf"CREATE \1INDEX {table}_{name} ON {table}", sql)
+            self.cursor.execute(sql)
+
+    def fetchone(self):
+        return convert_row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [convert_row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return (convert_row(row) for row in self.cursor)
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    # Соединение с файлом базы. Транзакция записи начинается первым изменяющим запросом (BEGIN IMMEDIATE),
+    # поэтому параллельные записи ждут друг друга, а не завершаются ошибкой блокировки
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                          detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in PRAGMAS:
+            self.connection.execute(pragma)
+
+    def begin(self):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE")
+
+    def cursor(self, *args, **kwargs):
+        # prepared и buffered не нужны: SQLite кэширует разобранные запросы, результат читается из файла
+        return SQLiteCursor(self)
+
+    def commit(self):
+        if self.connection.in_transaction:
+            self.connection.execute("COMMIT")
+
+    def rollback(self):
+        if self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+
+    def ping(self, *args, **kwargs):
+        # Соединение с файлом не разрывается при простое
+        pass
+
+    def close(self):
+        self.connection.close()
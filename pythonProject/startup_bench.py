@@ -0,0 +1,138 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Программа: модуль, класс окна и роль для автоматического входа (None - окно без входа)
+APPS = {
+    "warehouse": ("warehouse", "WarehouseApp", "manager"),
+    "transport": ("transport", "TransportApp", None),
+    "restaurant": ("restaurant", "RestaurantApp", "admin"),
+}
+RUNS = 5
+# Предельное время ожидания первых данных, с
+DATA_TIMEOUT = 60
+POLL_INTERVAL = 5
+
+
+def measure(name, launched):
+    # Выполняется в отдельном процессе: все времена - от запуска процесса родителем, мс
+    def elapsed():
+        return round((time.time() - launched) * 1000, 1)
+
+    result = {"app": name, "started_ms": elapsed()}
+    import importlib
+    import tkinter as tk
+    from tkinter import messagebox
+
+    module_name, class_name, role = APPS[name]
+    module = importlib.import_module(module_name)
+    result["import_ms"] = elapsed()
+
+    errors = []
+    # Окно ошибки остановило бы замер: ошибки только запоминаются
+    messagebox.showerror = lambda title, message, **options: errors.append(message)
+    messagebox.showinfo = lambda title, message, **options: None
+
+    root = tk.Tk()
+    app = getattr(module, class_name)(root)
+    root.update()
+    result["first_frame_ms"] = elapsed()
+    result["mysql_loaded_at_frame"] = "mysql.connector" in sys.modules
+
+    if role is not None:
+        app.role_var.set(role)
+        app.login()
+
+    deadline = time.monotonic() + DATA_TIMEOUT
+
+    def poll():
+        # Первые данные: в таблице есть строки или все запросы запуска выполнены (таблица пуста)
+        if app.tree.get_children() or app.executor.active == 0:
+            result["first_data_ms"] = elapsed()
+            result["rows"] = len(app.tree.get_children())
+            root.quit()
+        elif errors or time.monotonic() > deadline:
+            root.quit()
+        else:
+            root.after(POLL_INTERVAL, poll)
+
+    root.after(POLL_INTERVAL, poll)
+    root.mainloop()
+    if errors:
+        result["error"] = errors[0]
+    elif "first_data_ms" not in result:
+        result["error"] = f"нет данных за {DATA_TIMEOUT} с"
+    root.destroy()
+    return result
+
+
+def run_once(name):
+    process = subprocess.run(
+        [sys.executable, __file__, "--child", name, "--launched", repr(time.time())],
+        capture_output=True, text=True, timeout=DATA_TIMEOUT + 30
+    )
+    lines = [line for line in process.stdout.splitlines() if line.startswith("{")]
+    if process.returncode != 0 or not lines:
+        error = (process.stderr.strip().splitlines() or ["процесс завершился с ошибкой"])[-1]
+        return {"app": name, "error": error}
+    return json.loads(lines[-1])
+
+
+def summarize(runs):
+    summary = {}
+    for metric in ("import_ms", "first_frame_ms", "first_data_ms"):
+        values = [run[metric] for run in runs if metric in run]
+        if values:
+            summary[metric] = {
+                "median": round(statistics.median(values), 1),
+                "min": min(values),
+                "max": max(values),
+            }
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        summary["errors"] = errors
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска программ: до первого кадра и до первых данных")
+    parser.add_argument("apps", nargs="*", metavar="app",
+                        help=f"программы: {', '.join(APPS)} (по умолчанию все)")
+    parser.add_argument("--runs", type=int, default=RUNS, help=f"запусков каждой программы (по умолчанию {RUNS})")
+    parser.add_argument("--json", dest="json_path", metavar="FILE", help="сохранить результаты в JSON")
+    parser.add_argument("--child", choices=sorted(APPS), help=argparse.SUPPRESS)
+    parser.add_argument("--launched", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.launched), ensure_ascii=False))
+        return
+    unknown = [name for name in args.apps if name not in APPS]
+    if unknown:
+        parser.error(f"неизвестные программы: {', '.join(unknown)}")
+
+    results = {}
+    for name in args.apps or list(APPS):
+        runs = [run_once(name) for _ in range(args.runs)]
+        results[name] = {"runs": runs, "summary": summarize(runs)}
+
+        summary = results[name]["summary"]
+        line = [f"{name:<12}"]
+        for metric, title in (("import_ms", "импорт"), ("first_frame_ms", "первый кадр"),
+                              ("first_data_ms", "первые данные")):
+            if metric in summary:
+                line.append(f"{title}: {summary[metric]['median']:.0f} мс")
+        print("  ".join(line))
+        for error in sorted(set(summary.get("errors", []))):
+            print(f"{'':<12}ошибка: {error}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,152 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import mysql.connector
-from datetime import datetime, timedelta
-from plyer import notification
+from tkinter import ttk, messagebox, simpledialog
+from dbworker import QueryExecutor
+from changes import ChangePoller, patch_tree
+import metrics
+from transport_service import SERVICE, SEARCH_LIMIT, next_maintenance_date
+from datetime import datetime, timedelta, time as dtime
+import heapq
 import threading
 import time
 
+# Напоминание о ТО: за сколько дней до даты и в котором часу
+REMINDER_DAYS = 7
+NOTIFY_HOUR = 9
+# Сколько ТС перечисляется в одном сводном уведомлении
+DIGEST_SIZE = 10
+# Полная сверка с базой на случай изменений с других терминалов, с
+RESYNC_INTERVAL = 6 * 3600
+RETRY_DELAY = 60
+
+# Поиск: задержка после последнего нажатия клавиши, мс
+SEARCH_DELAY = 250
+
+
+class MaintenanceScheduler:
+    # Очередь дат напоминаний: поток спит ровно до ближайшего события или до изменения из интерфейса
+    def __init__(self, database, prepare=None):
+        # database - соединение для SERVICE.bind: Database или клиент сервера.
+        # prepare(db) - задание перед первой загрузкой (миграции); повторяется, пока база недоступна
+        self.database = database
+        self.prepare = prepare
+        self.condition = threading.Condition()
+        self.queue = []
+        self.vehicles = {}
+        self.notified = set()
+        self.next_resync = 0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    @staticmethod
+    def notify_at(next_maintenance):
+        return datetime.combine(next_maintenance - timedelta(days=REMINDER_DAYS), dtime(NOTIFY_HOUR))
+
+    def update(self, vehicle_id, vehicle_number, next_maintenance):
+        with self.condition:
+            # Повторное сообщение о неизмененном ТС (опрос изменений) не добавляет запись в очередь
+            if self.vehicles.get(vehicle_id) == (vehicle_number, next_maintenance):
+                return
+            self.vehicles[vehicle_id] = (vehicle_number, next_maintenance)
+            heapq.heappush(self.queue, (self.notify_at(next_maintenance), vehicle_id, next_maintenance))
+            self.condition.notify()
+
+    def remove(self, vehicle_id):
+        # Запись в очереди остается и будет пропущена при извлечении
+        with self.condition:
+            self.vehicles.pop(vehicle_id, None)
+            self.condition.notify()
+
+    def load(self):
+        rows, notified_rows = SERVICE.bind("fetch_maintenance_schedule")(self.database.connect())
+        vehicles = {row[0]: (row[1], row[2]) for row in rows}
+        notified = {(row[0], row[1]) for row in notified_rows}
+
+        queue = [(self.notify_at(date), vehicle_id, date) for vehicle_id, (number, date) in vehicles.items()
+                 if (vehicle_id, date) not in notified]
+        heapq.heapify(queue)
+        with self.condition:
+            self.vehicles = vehicles
+            self.notified = notified
+            self.queue = queue
+        self.next_resync = time.monotonic() + RESYNC_INTERVAL
+
+    def wait_for_due(self):
+        with self.condition:
+            while True:
+                now = datetime.now()
+                due = []
+                taken = set()
+                while self.queue and self.queue[0][0] <= now:
+                    notify_at, vehicle_id, next_maintenance = heapq.heappop(self.queue)
+                    current = self.vehicles.get(vehicle_id)
+                    # Устаревшая запись: ТС удалено, дата ТО изменена или напоминание уже было
+                    if current is None or current[1] != next_maintenance:
+                        continue
+                    if (vehicle_id, next_maintenance) in self.notified or (vehicle_id, next_maintenance) in taken:
+                        continue
+                    # В notified напоминание попадает только после отправки (send_digest)
+                    taken.add((vehicle_id, next_maintenance))
+                    due.append((vehicle_id, current[0], next_maintenance))
+                if due:
+                    return due
+
+                timeout = self.next_resync - time.monotonic()
+                if self.queue:
+                    timeout = min(timeout, (self.queue[0][0] - now).total_seconds())
+                if timeout <= 0:
+                    return []
+                self.condition.wait(timeout)
+
+    def send_digest(self, due):
+        # plyer загружается при первом напоминании, а не при запуске программы
+        from plyer import notification
+
+        # Все ТС, у которых напоминание наступило одновременно, попадают в одно уведомление
+        due.sort(key=lambda vehicle: vehicle[2])
+        lines = [f"ТС {number} - ТО {date.strftime('%d.%m.%Y')}" for _, number, date in due[:DIGEST_SIZE]]
+        if len(due) > DIGEST_SIZE:
+            lines.append(f"и еще {len(due) - DIGEST_SIZE} ТС")
+        notification.notify(
+            title=f'Напоминание о техобслуживании ({len(due)} ТС)',
+            message="\n".join(lines),
+            app_icon=None,
+            timeout=10,
+        )
+
+        sent = [(vehicle_id, date) for vehicle_id, _, date in due]
+        with self.condition:
+            self.notified.update(sent)
+        SERVICE.bind("record_notifications", sent, datetime.now())(self.database.connect())
+
+    def requeue(self, due):
+        # Напоминания, которые не удалось показать, возвращаются в очередь и уйдут при следующей попытке
+        with self.condition:
+            for vehicle_id, _, next_maintenance in due:
+                if (vehicle_id, next_maintenance) not in self.notified:
+                    heapq.heappush(self.queue, (self.notify_at(next_maintenance), vehicle_id, next_maintenance))
+
+    def run(self):
+        prepared = self.prepare is None
+        while True:
+            try:
+                if not prepared:
+                    self.prepare(self.database.connect())
+                    prepared = True
+                if time.monotonic() >= self.next_resync:
+                    self.load()
+                due = self.wait_for_due()
+                if due:
+                    try:
+                        self.send_digest(due)
+                    except Exception:
+                        self.requeue(due)
+                        raise
+            except Exception as e:
+                print(f"Ошибка при проверке ТО: {str(e)}")
+                self.database.discard()
+                time.sleep(RETRY_DELAY)
+
 
 class TransportApp:
     def __init__(self, root):
@@ -13,38 +154,32 @@ class TransportApp:
         self.root.title("Система управления транспортным парком")
         self.root.geometry("1200x800")
 
-        # Подключение к базе данных
-        self.db = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="12345678",
-            database="transport_db"
-        )
-        self.cursor = self.db.cursor()
+        # Время запросов, задержки главного цикла и ошибки - если включено в разделе [metrics] db.ini
+        metrics.start("transport", self.root)
+
+        # Все запросы интерфейса выполняются в фоновом потоке, с базой напрямую или через сервер
+        backend = SERVICE.backend()
+        self.executor = QueryExecutor(self.root, backend, on_busy=self.set_busy)
 
         # Создание таблицы, если она не существует
-        self.create_table()
+        self.executor.submit(SERVICE.bind("create_table"))
+
+        # Планировщик напоминаний о ТО сам создает таблицы перед первой загрузкой и повторяет попытки,
+        # пока база недоступна, - напоминания начнут работать, когда база появится
+        self.scheduler = MaintenanceScheduler(backend, prepare=SERVICE.bind("create_table"))
+        self.scheduler.start()
 
         # Создание интерфейса
         self.create_gui()
 
-        # Запуск проверки технического обслуживания в отдельном потоке
-        self.maintenance_thread = threading.Thread(target=self.check_maintenance, daemon=True)
-        self.maintenance_thread.start()
-
-    def create_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transport_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                driver_name VARCHAR(100),
-                vehicle_number VARCHAR(20),
-                route_number VARCHAR(20),
-                last_maintenance DATE,
-                next_maintenance DATE,
-                status VARCHAR(20)
-            )
-        """)
-        self.db.commit()
+        # Изменения с других терминалов применяются к таблице и к очереди напоминаний на месте
+        self.poller = ChangePoller(self.root, self.executor, SERVICE, self.apply_changes, self.refresh_data)
+        self.poller.start()
+
+    def set_busy(self, busy):
+        self.root.configure(cursor="watch" if busy else "")
+        if hasattr(self, "status_label"):
+            self.status_label.configure(text="Загрузка..." if busy else "")
 
     def create_gui(self):
         # Создание основного фрейма
@@ -81,6 +216,29 @@ class TransportApp:
         ttk.Button(btn_frame, text="Изменить", command=self.update_vehicle).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Удалить", command=self.delete_vehicle).pack(side="left", padx=5)
 
+        # Групповые операции над всеми выделенными ТС
+        bulk_frame = ttk.Frame(input_frame)
+        bulk_frame.grid(row=5, column=0, columnspan=2, pady=5)
+
+        ttk.Button(bulk_frame, text="ТО выполнено сегодня", command=self.mark_maintained).pack(side="left", padx=5)
+        ttk.Button(bulk_frame, text="Сменить маршрут", command=self.reassign_route).pack(side="left", padx=5)
+
+        # Строка состояния
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.pack(side="bottom", anchor="w", padx=10)
+
+        # Поиск по номеру ТС, ФИО водителя и номеру маршрута
+        search_frame = ttk.Frame(main_frame)
+        search_frame.pack(padx=10, pady=5, fill="x")
+
+        ttk.Label(search_frame, text="Поиск:").pack(side="left", padx=5)
+        self.search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.search_var, width=40).pack(side="left", padx=5)
+        self.found_label = ttk.Label(search_frame, text="")
+        self.found_label.pack(side="left", padx=5)
+        self.search_timer = None
+        self.search_var.trace_add("write", self.on_search_change)
+
         # Таблица транспортных средств
         self.tree = ttk.Treeview(main_frame, columns=(
             "ID", "ФИО водителя", "Номер ТС", "№ маршрута",
@@ -103,31 +261,26 @@ class TransportApp:
 
     def add_vehicle(self):
         try:
-            last_maintenance = datetime.strptime(self.last_maintenance.get(), '%Y-%m-%d')
-            next_maintenance = last_maintenance + timedelta(days=30)  # ТО через каждые 30 дней
-
-            query = """
-                INSERT INTO transport_data (
-                    driver_name, vehicle_number, route_number,
-                    last_maintenance, next_maintenance, status
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-            """
+            last_maintenance = datetime.strptime(self.last_maintenance.get(), '%Y-%m-%d').date()
+            next_maintenance = next_maintenance_date(last_maintenance)
+
             values = (
                 self.driver_name.get(),
                 self.vehicle_number.get(),
                 self.route_number.get(),
-                last_maintenance,
-                next_maintenance,
-                "Активен"
+                last_maintenance
             )
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
 
-            self.cursor.execute(query, values)
-            self.db.commit()
+        def done(vehicle_id):
+            self.scheduler.update(vehicle_id, values[1], next_maintenance)
             self.refresh_data()
             self.clear_fields()
             messagebox.showinfo("Успех", "Транспортное средство добавлено!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+
+        self.executor.submit(SERVICE.bind("insert_vehicle", *values), done)
 
     def update_vehicle(self):
         selected = self.tree.selection()
@@ -136,35 +289,27 @@ class TransportApp:
             return
 
         try:
-            last_maintenance = datetime.strptime(self.last_maintenance.get(), '%Y-%m-%d')
-            next_maintenance = last_maintenance + timedelta(days=30)
+            last_maintenance = datetime.strptime(self.last_maintenance.get(), '%Y-%m-%d').date()
+            next_maintenance = next_maintenance_date(last_maintenance)
 
             vehicle_id = self.tree.item(selected[0])['values'][0]
-            query = """
-                UPDATE transport_data SET
-                    driver_name = %s,
-                    vehicle_number = %s,
-                    route_number = %s,
-                    last_maintenance = %s,
-                    next_maintenance = %s
-                WHERE id = %s
-            """
             values = (
                 self.driver_name.get(),
                 self.vehicle_number.get(),
                 self.route_number.get(),
-                last_maintenance,
-                next_maintenance,
-                vehicle_id
+                last_maintenance
             )
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
 
-            self.cursor.execute(query, values)
-            self.db.commit()
+        def done(result):
+            self.scheduler.update(vehicle_id, values[1], next_maintenance)
             self.refresh_data()
             self.clear_fields()
             messagebox.showinfo("Успех", "Данные обновлены!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+
+        self.executor.submit(SERVICE.bind("update_vehicle", vehicle_id, *values), done)
 
     def delete_vehicle(self):
         selected = self.tree.selection()
@@ -172,12 +317,58 @@ class TransportApp:
             messagebox.showerror("Ошибка", "Выберите транспортное средство для удаления!")
             return
 
-        if messagebox.askyesno("Подтверждение", "Удалить выбранное транспортное средство?"):
-            vehicle_id = self.tree.item(selected[0])['values'][0]
-            self.cursor.execute("DELETE FROM transport_data WHERE id = %s", (vehicle_id,))
-            self.db.commit()
+        if len(selected) > 1:
+            question = f"Удалить выбранные транспортные средства ({len(selected)})?"
+        else:
+            question = "Удалить выбранное транспортное средство?"
+
+        if messagebox.askyesno("Подтверждение", question):
+            vehicle_ids = [self.tree.item(item)['values'][0] for item in selected]
+
+            def done(result):
+                for vehicle_id in vehicle_ids:
+                    self.scheduler.remove(vehicle_id)
+                self.refresh_data()
+                self.clear_fields()
+
+            self.executor.submit(SERVICE.bind("delete_vehicles", vehicle_ids), done)
+
+    def mark_maintained(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showerror("Ошибка", "Выберите транспортные средства!")
+            return
+
+        vehicles = [(values[0], values[2]) for values in (self.tree.item(item)['values'] for item in selected)]
+        last_maintenance = datetime.now().date()
+        next_maintenance = next_maintenance_date(last_maintenance)
+
+        def done(affected):
+            for vehicle_id, vehicle_number in vehicles:
+                self.scheduler.update(vehicle_id, vehicle_number, next_maintenance)
             self.refresh_data()
-            self.clear_fields()
+            messagebox.showinfo("Успех", f"ТО отмечено для {affected} ТС!")
+
+        self.executor.submit(SERVICE.bind("mark_maintained", [v[0] for v in vehicles], last_maintenance), done)
+
+    def reassign_route(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showerror("Ошибка", "Выберите транспортные средства!")
+            return
+
+        route_number = simpledialog.askstring("Сменить маршрут", f"Новый № маршрута для {len(selected)} ТС:",
+                                              parent=self.root)
+        if not route_number:
+            return
+
+        vehicle_ids = [self.tree.item(item)['values'][0] for item in selected]
+
+        def done(affected):
+            self.refresh_data()
+            messagebox.showinfo("Успех", f"Маршрут изменен для {affected} ТС!")
+
+        self.executor.submit(SERVICE.bind("reassign_route", vehicle_ids, route_number.strip()), done)
 
     def on_select(self, event):
         selected = self.tree.selection()
@@ -203,39 +394,46 @@ class TransportApp:
         self.last_maintenance.delete(0, tk.END)
         self.last_maintenance.insert(0, datetime.now().strftime('%Y-%m-%d'))
 
-    def refresh_data(self):
-        # Очистка таблицы
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def on_search_change(self, *args):
+        # Запрос уходит только после паузы в наборе
+        if self.search_timer is not None:
+            self.root.after_cancel(self.search_timer)
+        self.search_timer = self.root.after(SEARCH_DELAY, self.refresh_data)
 
-        # Получение данных из БД
-        self.cursor.execute("SELECT * FROM transport_data ORDER BY next_maintenance")
-        for row in self.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
-
-    def check_maintenance(self):
-        while True:
-            try:
-                # Проверка ТС, у которых скоро ТО
-                self.cursor.execute("""
-                    SELECT vehicle_number, next_maintenance 
-                    FROM transport_data 
-                    WHERE next_maintenance <= DATE_ADD(CURDATE(), INTERVAL 7 DAY)
-                """)
-
-                for vehicle in self.cursor.fetchall():
-                    vehicle_number, maintenance_date = vehicle
-                    notification.notify(
-                        title='Напоминание о техобслуживании',
-                        message=f'ТС {vehicle_number} требует ТО {maintenance_date}',
-                        app_icon=None,
-                        timeout=10,
-                    )
-            except Exception as e:
-                print(f"Ошибка при проверке ТО: {str(e)}")
-
-            # Проверка каждые 24 часа
-            time.sleep(86400)
+    def refresh_data(self):
+        self.search_timer = None
+        text = self.search_var.get().strip()
+
+        def done(rows):
+            # Очистка таблицы
+            self.tree.delete(*self.tree.get_children())
+            for row in rows:
+                self.tree.insert("", "end", iid=str(row[0]), values=row)
+            if text:
+                suffix = "+" if len(rows) >= SEARCH_LIMIT else ""
+                self.found_label.configure(text=f"Найдено: {len(rows)}{suffix}")
+            else:
+                self.found_label.configure(text="")
+
+        # Получение данных из БД; новый запрос отменяет результат предыдущего, еще не показанного
+        if text:
+            self.executor.submit(SERVICE.bind("search_vehicles", text), done, key="refresh")
+        else:
+            self.executor.submit(SERVICE.bind("fetch_vehicles"), done, key="refresh")
+
+    def apply_changes(self, rows, deleted):
+        for vehicle_id in deleted:
+            self.scheduler.remove(vehicle_id)
+        for row in rows:
+            if row[5] is not None:
+                self.scheduler.update(row[0], row[2], row[5])
+
+        # При активном поиске новые ТС показываются, только если подходят под поиск (по началу значения)
+        text = self.search_var.get().strip().lower()
+        accept = None
+        if text:
+            accept = lambda row: any(str(value or "").lower().startswith(text) for value in row[1:4])
+        patch_tree(self.tree, rows, deleted, key=lambda values: str(values[5]), accept=accept)
 
 
 if __name__ == "__main__":
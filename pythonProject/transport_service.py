@@ -0,0 +1,223 @@
+from migrations import run_migrations, add_index
+from db import Database, prepared
+from service import Service
+from changes import add_change_tracking, fetch_changed_rows, prune_tombstones
+from datetime import timedelta
+
+# ТО через каждые 30 дней
+MAINTENANCE_INTERVAL_DAYS = 30
+
+# Предел числа ТС, найденных поиском
+SEARCH_LIMIT = 500
+
+# Групповые операции: идентификаторов в одном IN (...)
+BULK_CHUNK_SIZE = 1000
+
+# Столбцы таблицы ТС в порядке столбцов интерфейса
+COLUMNS = "id, driver_name, vehicle_number, route_number, last_maintenance, next_maintenance, status"
+
+
+def add_search_indexes(cursor):
+    add_index(cursor, "transport_data", "idx_vehicle_number", "vehicle_number")
+    add_index(cursor, "transport_data", "idx_driver_name", "driver_name")
+    add_index(cursor, "transport_data", "idx_route_number", "route_number")
+
+
+MIGRATIONS = [
+    (1, "Таблица транспортных средств", ["""
+        CREATE TABLE IF NOT EXISTS transport_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            driver_name VARCHAR(100),
+            vehicle_number VARCHAR(20),
+            route_number VARCHAR(20),
+            last_maintenance DATE,
+            next_maintenance DATE,
+            status VARCHAR(20)
+        )
+    """]),
+    (2, "Индекс по дате следующего ТО",
+     lambda cursor: add_index(cursor, "transport_data", "idx_next_maintenance", "next_maintenance")),
+    (3, "Отправленные напоминания о ТО", ["""
+        CREATE TABLE IF NOT EXISTS maintenance_notifications (
+            vehicle_id INT NOT NULL,
+            next_maintenance DATE NOT NULL,
+            notified_at DATETIME,
+            PRIMARY KEY (vehicle_id, next_maintenance)
+        )
+    """]),
+    (4, "Индексы для поиска по номеру ТС, водителю и маршруту", add_search_indexes),
+    (5, "Время изменения и удаленные ТС для синхронизации терминалов",
+     lambda cursor: add_change_tracking(cursor, "transport_data")),
+]
+
+
+DATABASE = Database("transport_db")
+
+
+def create_table(db):
+    run_migrations(db, MIGRATIONS)
+    prune_tombstones(db)
+
+
+def execute(db, query, values):
+    cursor = prepared(db, query)
+    cursor.execute(query, values)
+    db.commit()
+    return cursor.lastrowid
+
+
+def fetch_vehicles(db):
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT {COLUMNS} FROM transport_data ORDER BY next_maintenance")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def bulk_execute(db, query, ids, params=()):
+    # Одна транзакция на всю группу; {ids} в запросе заменяется списком параметров
+    cursor = db.cursor()
+    try:
+        affected = 0
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            cursor.execute(query.format(ids=", ".join(["%s"] * len(chunk))), tuple(params) + tuple(chunk))
+            affected += cursor.rowcount
+        db.commit()
+        return affected
+    finally:
+        cursor.close()
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_vehicles(db, text, limit=SEARCH_LIMIT):
+    # Поиск по началу значения; UNION вместо OR, чтобы каждая часть шла по своему индексу
+    query = f"""
+        SELECT * FROM (
+            SELECT {COLUMNS} FROM transport_data WHERE vehicle_number LIKE %s
+            UNION
+            SELECT {COLUMNS} FROM transport_data WHERE driver_name LIKE %s
+            UNION
+            SELECT {COLUMNS} FROM transport_data WHERE route_number LIKE %s
+        ) found
+        ORDER BY next_maintenance
+        LIMIT %s
+    """
+    pattern = escape_like(text) + "%"
+    cursor = prepared(db, query)
+    cursor.execute(query, (pattern, pattern, pattern, limit))
+    return cursor.fetchall()
+
+
+def fetch_changes(db, since):
+    # ТС, измененные с since, и удаленные ТС - для обновления таблицы без полной перезагрузки
+    return fetch_changed_rows(db, "transport_data", COLUMNS, since)
+
+
+def next_maintenance_date(last_maintenance):
+    return last_maintenance + timedelta(days=MAINTENANCE_INTERVAL_DAYS)
+
+
+def insert_vehicle(db, driver_name, vehicle_number, route_number, last_maintenance):
+    query = """
+        INSERT INTO transport_data (
+            driver_name, vehicle_number, route_number,
+            last_maintenance, next_maintenance, status
+        ) VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    values = (
+        driver_name,
+        vehicle_number,
+        route_number,
+        last_maintenance,
+        next_maintenance_date(last_maintenance),
+        "Активен"
+    )
+    return execute(db, query, values)
+
+
+def update_vehicle(db, vehicle_id, driver_name, vehicle_number, route_number, last_maintenance):
+    query = """
+        UPDATE transport_data SET
+            driver_name = %s,
+            vehicle_number = %s,
+            route_number = %s,
+            last_maintenance = %s,
+            next_maintenance = %s
+        WHERE id = %s
+    """
+    values = (
+        driver_name,
+        vehicle_number,
+        route_number,
+        last_maintenance,
+        next_maintenance_date(last_maintenance),
+        vehicle_id
+    )
+    execute(db, query, values)
+
+
+def delete_vehicles(db, vehicle_ids):
+    return bulk_execute(db, "DELETE FROM transport_data WHERE id IN ({ids})", vehicle_ids)
+
+
+def mark_maintained(db, vehicle_ids, last_maintenance):
+    query = "UPDATE transport_data SET last_maintenance = %s, next_maintenance = %s WHERE id IN ({ids})"
+    return bulk_execute(db, query, vehicle_ids, (last_maintenance, next_maintenance_date(last_maintenance)))
+
+
+def reassign_route(db, vehicle_ids, route_number):
+    query = "UPDATE transport_data SET route_number = %s WHERE id IN ({ids})"
+    return bulk_execute(db, query, vehicle_ids, (route_number,))
+
+
+def fetch_maintenance_schedule(db):
+    # Даты следующего ТО и уже отправленные по ним напоминания
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, vehicle_number, next_maintenance FROM transport_data
+            WHERE next_maintenance IS NOT NULL
+        """)
+        vehicles = cursor.fetchall()
+        cursor.execute("""
+            SELECT n.vehicle_id, n.next_maintenance FROM maintenance_notifications n
+            JOIN transport_data t ON t.id = n.vehicle_id AND t.next_maintenance = n.next_maintenance
+        """)
+        notified = cursor.fetchall()
+    finally:
+        cursor.close()
+    return vehicles, notified
+
+
+def record_notifications(db, sent, notified_at):
+    # sent - список (id ТС, дата ТО), по которым отправлено напоминание
+    cursor = db.cursor()
+    try:
+        cursor.executemany("""
+            INSERT IGNORE INTO maintenance_notifications (vehicle_id, next_maintenance, notified_at)
+            VALUES (%s, %s, %s)
+        """, [(vehicle_id, date, notified_at) for vehicle_id, date in sent])
+        db.commit()
+    finally:
+        cursor.close()
+
+
+# Операции, которые интерфейс вызывает через SERVICE.bind - локально или на сервере
+SERVICE = Service("transport", DATABASE, [
+    create_table,
+    fetch_vehicles,
+    search_vehicles,
+    fetch_changes,
+    insert_vehicle,
+    update_vehicle,
+    delete_vehicles,
+    mark_maintained,
+    reassign_route,
+    fetch_maintenance_schedule,
+    record_notifications,
+])
@@ -0,0 +1,81 @@
+import math
+import re
+from array import array
+from collections import Counter
+
+# Доля триграмм запроса, которая должна найтись в строке, чтобы она попала в результат
+MIN_SIMILARITY = 0.3
+# Кандидатов с наибольшим числом совпавших триграмм на одно место результата - для точного ранжирования
+RERANK_FACTOR = 4
+# Все, кроме букв и цифр, разделяет слова
+SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    # Без учета регистра и различия е/ё
+    return SEPARATORS.sub(" ", str(text or "").lower().replace("ё", "е")).strip()
+
+
+def trigrams(text):
+    # Слово дополняется пробелами, как в pg_trgm: "  мо", " мол", ..., "ко " - совпадение начала слова весит больше
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    # Нечеткий поиск по названию товара и поставщику в памяти процесса.
+    # Для каждой триграммы - массив id строк, для каждой строки - нормализованный текст (нужен для удаления)
+    def __init__(self):
+        self.postings = {}
+        self.texts = {}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, row_id, *fields):
+        text = normalize(" ".join(str(field or "") for field in fields))
+        if self.texts.get(row_id) == text:
+            return
+        self.remove(row_id)
+        self.texts[row_id] = text
+        for gram in trigrams(text):
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array("i")
+            postings.append(row_id)
+
+    def remove(self, row_id):
+        text = self.texts.pop(row_id, None)
+        if text is None:
+            return
+        for gram in trigrams(text):
+            postings = self.postings[gram]
+            postings.remove(row_id)
+            if not postings:
+                del self.postings[gram]
+
+    def search(self, query, limit):
+        # id строк по убыванию сходства с запросом
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        # Подсчет совпадений идет в C (Counter по массивам id), без цикла Python по строкам
+        counts = Counter()
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is not None:
+                counts.update(postings)
+        required = max(1, math.ceil(len(grams) * MIN_SIMILARITY))
+        candidates = [(row_id, count) for row_id, count in counts.most_common(limit * RERANK_FACTOR)
+                      if count >= required]
+
+        # Сходство как в pg_trgm: общие триграммы / все триграммы запроса и строки
+        def similarity(candidate):
+            row_id, count = candidate
+            return count / (len(grams) + len(trigrams(self.texts[row_id])) - count), -row_id
+
+        candidates.sort(key=similarity, reverse=True)
+        return [row_id for row_id, _ in candidates[:limit]]
@@ -1,7 +1,100 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import mysql.connector
-from datetime import datetime
+from tkinter import ttk, messagebox, filedialog, simpledialog
+import argparse
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dbworker import QueryExecutor
+from journal import OperationJournal
+from changes import ChangePoller, patch_tree
+from trigram import TrigramIndex
+import metrics
+from service import ServiceClient
+from warehouse_service import (
+    DATABASE, SERVICE, PAGE_SIZE, IMPORT_CHUNK_SIZE, StockConflict, create_table, ensure_daily_snapshot,
+    import_csv, format_import_summary, generate_inventory_report, write_inventory_report, write_stock_report
+)
+
+# Виртуальная таблица: в Treeview только видимые строки, остальное подгружается страницами
+VIRTUAL_TREE = True
+PAGE_CACHE_SIZE = 10
+PREFETCH_ROWS = 50
+
+# Период проверки суточного снимка остатков
+SNAPSHOT_CHECK_INTERVAL = 3600 * 1000
+
+# Фильтр над таблицей: нечеткий поиск по товару и поставщику; задержка после нажатия клавиши, мс
+FILTER_DELAY = 250
+FILTER_LIMIT = 200
+
+# Добавление товара, приход и расход сначала пишутся в локальный журнал, затем переносятся в базу
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warehouse_journal.jsonl")
+
+
+class ProductPager:
+    # Кэш страниц товаров, выбранных по ключу (last_operation_date, id), ограниченного размера.
+    # Кэш меняется только в потоке Tk, страницы загружает операция fetch_pages в рабочем потоке.
+    def __init__(self, page_size=PAGE_SIZE, cache_size=PAGE_CACHE_SIZE):
+        self.page_size = page_size
+        self.cache_size = cache_size
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.pages = OrderedDict()
+        # Ключ последней строки предыдущей страницы для каждой известной страницы
+        self.bounds = {0: None}
+        self.total = None
+        self.generation += 1
+
+    def is_cached(self, number):
+        return number in self.pages
+
+    def patch(self, rows):
+        # Замена измененных строк в кэше на месте. False - строки нет в кэше или она сменила место в порядке
+        located = {}
+        for number, page in self.pages.items():
+            for index, cached in enumerate(page):
+                located[cached[0]] = (number, index)
+        for row in rows:
+            place = located.get(row[0])
+            if place is None or self.pages[place[0]][place[1]][7] != row[7]:
+                return False
+        for row in rows:
+            number, index = located[row[0]]
+            self.pages[number][index] = row
+        return True
+
+    def store(self, total, pages):
+        if total is not None:
+            self.total = total
+        for number, start, rows in pages:
+            self.bounds[number] = start
+            self.pages[number] = rows
+            self.pages.move_to_end(number)
+            if len(rows) == self.page_size:
+                self.bounds[number + 1] = (rows[-1][7], rows[-1][0])
+        while len(self.pages) > self.cache_size:
+            self.pages.popitem(last=False)
+
+    def cached_rows(self, offset, limit):
+        # Строки окна из кэша; если страницы нет - возвращается ее номер для загрузки
+        result = []
+        number = offset // self.page_size
+        start = offset % self.page_size
+        while len(result) < limit:
+            if number not in self.pages:
+                return None, number
+            self.pages.move_to_end(number)
+            rows = self.pages[number]
+            result.extend(rows[start:start + limit - len(result)])
+            if len(rows) < self.page_size:
+                break
+            number += 1
+            start = 0
+        return result, None
 
 
 class WarehouseApp:
@@ -10,36 +103,35 @@ class WarehouseApp:
         self.root.title("Система управления складом")
         self.root.geometry("1200x800")
 
-        # Подключение к базе данных
-        self.db = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="12345678",
-            database="warehouse_db"
-        )
-        self.cursor = self.db.cursor()
+        # Время запросов, задержки главного цикла и ошибки - если включено в разделе [metrics] db.ini
+        metrics.start("warehouse", self.root)
+
+        # Все запросы к базе выполняются в фоновом потоке
+        # Операции выполняются с базой напрямую или на сервере, если он задан в настройках
+        backend = SERVICE.backend()
+        self.executor = QueryExecutor(self.root, backend, on_busy=self.set_busy)
 
         # Создание таблицы, если она не существует
-        self.create_table()
+        self.executor.submit(SERVICE.bind("create_table"))
+
+        # Операции из журнала, включая оставшиеся с прошлого запуска, переносятся в базу, когда она доступна
+        self.journal = OperationJournal(
+            SERVICE, backend, JOURNAL_PATH, prepare=SERVICE.bind("create_table"),
+            on_applied=lambda batch, results, remaining: self.executor.call_soon(
+                self.journal_applied, batch, results, remaining))
+        self.journal.start()
+
+        # Индекс нечеткого поиска строится в фоне после показа первых строк и дальше обновляется по изменениям
+        self.search_index = None
+        self.index_backlog = None
 
         # Авторизация
         self.show_login()
 
-    def create_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS warehouse_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                product_name VARCHAR(100),
-                supplier_name VARCHAR(100),
-                quantity INT,
-                price DECIMAL(10, 2),
-                last_delivery DATE,
-                last_operation VARCHAR(20),
-                last_operation_date DATETIME,
-                status VARCHAR(20)
-            )
-        """)
-        self.db.commit()
+    def set_busy(self, busy):
+        self.root.configure(cursor="watch" if busy else "")
+        if hasattr(self, "status_label"):
+            self.status_label.configure(text="Загрузка..." if busy else "")
 
     def show_login(self):
         self.login_frame = ttk.Frame(self.root)
@@ -60,6 +152,11 @@ class WarehouseApp:
         self.current_role = role
         self.login_frame.destroy()
         self.create_main_interface()
+        self.check_snapshot()
+
+        # Изменения с других терминалов применяются к таблице на месте
+        self.poller = ChangePoller(self.root, self.executor, SERVICE, self.apply_changes, self.reload_data)
+        self.poller.start()
 
     def create_main_interface(self):
         # Основной фрейм
@@ -101,8 +198,38 @@ class WarehouseApp:
             ttk.Button(btn_frame, text="Изменить", command=self.edit_product).pack(side="left", padx=5)
             ttk.Button(btn_frame, text="Удалить", command=self.delete_product).pack(side="left", padx=5)
 
+        ttk.Button(btn_frame, text="Импорт поставки", command=self.import_delivery).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="История движения", command=self.show_history).pack(side="left", padx=5)
+
+        if self.current_role == "manager":
+            ttk.Button(btn_frame, text="Остаток на дату", command=self.show_stock_as_of).pack(side="left", padx=5)
+            ttk.Button(btn_frame, text="Отчет по запасам", command=self.generate_report).pack(side="left", padx=5)
+
+        # Строка состояния
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.pack(side="bottom", anchor="w", padx=10)
+        self.journal_label = ttk.Label(main_frame, text="")
+        self.journal_label.pack(side="bottom", anchor="w", padx=10)
+        self.update_journal_label(self.journal.count())
+
+        # Фильтр по товару и поставщику: находит и при опечатках, без учета регистра
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.pack(padx=10, pady=5, fill="x")
+
+        ttk.Label(filter_frame, text="Фильтр:").pack(side="left", padx=5)
+        self.filter_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.filter_var, width=40).pack(side="left", padx=5)
+        self.found_label = ttk.Label(filter_frame, text="")
+        self.found_label.pack(side="left", padx=5)
+        self.filter_timer = None
+        self.filter_rows = None
+        self.filter_var.trace_add("write", self.on_filter_change)
+
         # Таблица товаров
-        self.tree = ttk.Treeview(main_frame, columns=(
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(padx=10, pady=5, fill="both", expand=True)
+
+        self.tree = ttk.Treeview(tree_frame, columns=(
             "ID", "Товар", "Поставщик", "Количество", "Цена",
             "Последняя поставка", "Последняя операция", "Дата операции", "Статус"
         ), show="headings")
@@ -115,9 +242,24 @@ class WarehouseApp:
             self.tree.heading(i, text=header)
             self.tree.column(i, width=120)
 
-        self.tree.pack(padx=10, pady=5, fill="both", expand=True)
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient="vertical")
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
         self.tree.bind('<<TreeviewSelect>>', self.on_select)
 
+        if VIRTUAL_TREE:
+            self.pager = ProductPager()
+            self.offset = 0
+            self.visible_rows = 20
+            self.scrollbar.configure(command=self.on_scroll)
+            self.tree.bind("<Configure>", self.on_tree_resize)
+            self.tree.bind("<MouseWheel>", lambda e: self.scroll_rows(-1 if e.delta > 0 else 1, "units"))
+            self.tree.bind("<Button-4>", lambda e: self.scroll_rows(-1, "units"))
+            self.tree.bind("<Button-5>", lambda e: self.scroll_rows(1, "units"))
+        else:
+            self.scrollbar.configure(command=self.tree.yview)
+            self.tree.configure(yscrollcommand=self.scrollbar.set)
+
         # Обновление данных
         self.refresh_data()
 
@@ -125,33 +267,18 @@ class WarehouseApp:
         try:
             quantity = int(self.quantity.get())
             price = float(self.price.get())
-
-            query = """
-                INSERT INTO warehouse_data (
-                    product_name, supplier_name, quantity, price,
-                    last_delivery, last_operation, last_operation_date, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            values = (
-                self.product_name.get(),
-                self.supplier_name.get(),
-                quantity,
-                price,
-                datetime.now().date(),
-                "Поступление",
-                datetime.now(),
-                "В наличии"
-            )
-
-            self.cursor.execute(query, values)
-            self.db.commit()
-            self.refresh_data()
-            self.clear_fields()
-            messagebox.showinfo("Успех", "Товар добавлен!")
         except ValueError:
             messagebox.showerror("Ошибка", "Проверьте правильность ввода количества и цены!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+            return
+
+        product_name = self.product_name.get()
+        supplier_name = self.supplier_name.get()
+
+        # Товар появится в таблице, когда журнал перенесет его в базу
+        self.journal.submit("insert_product", product_name, supplier_name, quantity, price)
+        self.clear_fields()
+        self.update_journal_label(self.journal.count())
+        messagebox.showinfo("Успех", "Товар добавлен!")
 
     def update_quantity(self, operation_type):
         selected = self.tree.selection()
@@ -163,42 +290,60 @@ class WarehouseApp:
             change_qty = int(self.quantity.get())
             if change_qty <= 0:
                 raise ValueError("Количество должно быть положительным числом!")
+        except ValueError as ve:
+            messagebox.showerror("Ошибка", str(ve))
+            return
 
-            item_id = self.tree.item(selected[0])['values'][0]
-            current_qty = self.tree.item(selected[0])['values'][3]
+        item_id = self.tree.item(selected[0])['values'][0]
+        delta = change_qty if operation_type == "in" else -change_qty
+        operation = "Поступление" if operation_type == "in" else "Списание"
 
-            if operation_type == "out" and change_qty > current_qty:
-                messagebox.showerror("Ошибка", "Недостаточно товара на складе!")
-                return
+        # Нехватка товара или удаление с другого терминала сообщаются после переноса в базу
+        self.journal.submit("apply_movement", item_id, delta, operation)
+        self.clear_fields()
+        self.update_journal_label(self.journal.count())
+        messagebox.showinfo("Успех", f"Операция {operation.lower()} выполнена!")
+
+    def import_delivery(self):
+        path = filedialog.askopenfilename(title="Файл поставки",
+                                          filetypes=[("CSV", "*.csv"), ("Все файлы", "*.*")])
+        if not path:
+            return
 
-            new_qty = current_qty + change_qty if operation_type == "in" else current_qty - change_qty
-            operation = "Поступление" if operation_type == "in" else "Списание"
-
-            query = """
-                UPDATE warehouse_data SET
-                    quantity = %s,
-                    last_operation = %s,
-                    last_operation_date = %s,
-                    status = %s
-                WHERE id = %s
-            """
-            values = (
-                new_qty,
-                operation,
-                datetime.now(),
-                "В наличии" if new_qty > 0 else "Нет в наличии",
-                item_id
-            )
-
-            self.cursor.execute(query, values)
-            self.db.commit()
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Импорт поставки")
+        progress_window.transient(self.root)
+        progress_window.grab_set()
+        progress_label = ttk.Label(progress_window, text="Импортировано строк: 0")
+        progress_label.pack(padx=20, pady=10)
+        progress_bar = ttk.Progressbar(progress_window, length=300, maximum=1.0)
+        progress_bar.pack(padx=20, pady=10)
+
+        def show_progress(imported, fraction):
+            progress_label.configure(text=f"Импортировано строк: {imported}")
+            progress_bar.configure(value=fraction)
+
+        def progress(imported, fraction):
+            # Вызывается из рабочего потока, окно обновляется в потоке Tk
+            self.executor.call_soon(show_progress, imported, fraction)
+
+        def done(result):
+            progress_window.destroy()
             self.refresh_data()
-            self.clear_fields()
-            messagebox.showinfo("Успех", f"Операция {operation.lower()} выполнена!")
-        except ValueError as ve:
-            messagebox.showerror("Ошибка", str(ve))
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+            messagebox.showinfo("Импорт завершен", format_import_summary(*result))
+
+        def failed(error):
+            progress_window.destroy()
+            self.refresh_data()
+            messagebox.showerror("Ошибка", str(error))
+
+        if isinstance(self.executor.database, ServiceClient):
+            # Через сервер файл передается целиком, без промежуточного прогресса
+            with open(path, encoding="utf-8-sig") as f:
+                text = f.read()
+            self.executor.submit(SERVICE.bind("import_csv_text", text), done, failed)
+        else:
+            self.executor.submit(lambda db: import_csv(db, path, progress=progress), done, failed)
 
     def edit_product(self):
         if self.current_role != "manager":
@@ -211,30 +356,25 @@ class WarehouseApp:
             return
 
         try:
-            item_id = self.tree.item(selected[0])['values'][0]
-            query = """
-                UPDATE warehouse_data SET
-                    product_name = %s,
-                    supplier_name = %s,
-                    price = %s
-                WHERE id = %s
-            """
-            values = (
-                self.product_name.get(),
-                self.supplier_name.get(),
-                float(self.price.get()),
-                item_id
-            )
-
-            self.cursor.execute(query, values)
-            self.db.commit()
+            price = float(self.price.get())
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте правильность ввода цены!")
+            return
+
+        row = self.tree.item(selected[0])['values']
+        item_id, version = row[0], row[9]
+        product_name = self.product_name.get()
+        supplier_name = self.supplier_name.get()
+
+        def done(result):
+            self.update_search_index([(item_id, product_name, supplier_name)], [])
             self.refresh_data()
             self.clear_fields()
             messagebox.showinfo("Успех", "Данные обновлены!")
-        except ValueError:
-            messagebox.showerror("Ошибка", "Проверьте правильность ввода цены!")
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+
+        self.executor.submit(
+            SERVICE.bind("update_product", item_id, version, product_name, supplier_name, price),
+            done, self.on_db_error)
 
     def delete_product(self):
         if self.current_role != "manager":
@@ -247,11 +387,115 @@ class WarehouseApp:
             return
 
         if messagebox.askyesno("Подтверждение", "Удалить выбранный товар?"):
-            item_id = self.tree.item(selected[0])['values'][0]
-            self.cursor.execute("DELETE FROM warehouse_data WHERE id = %s", (item_id,))
-            self.db.commit()
+            row = self.tree.item(selected[0])['values']
+            item_id, version = row[0], row[9]
+
+            def done(result):
+                self.update_search_index([], [item_id])
+                self.refresh_data()
+                self.clear_fields()
+
+            self.executor.submit(SERVICE.bind("delete_product", item_id, version), done, self.on_db_error)
+
+    def show_history(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showerror("Ошибка", "Выберите товар!")
+            return
+
+        values = self.tree.item(selected[0])['values']
+        history_window = tk.Toplevel(self.root)
+        history_window.title(f"История движения: {values[1]}")
+        history_window.geometry("700x400")
+
+        tree = ttk.Treeview(history_window, columns=("Дата", "Операция", "Изменение", "Остаток"), show="headings")
+        for header in ("Дата", "Операция", "Изменение", "Остаток"):
+            tree.heading(header, text=header)
+            tree.column(header, width=150)
+        tree.pack(padx=10, pady=10, fill="both", expand=True)
+
+        def done(rows):
+            if not history_window.winfo_exists():
+                return
+            for row in rows:
+                tree.insert("", "end", values=row)
+
+        self.executor.submit(SERVICE.bind("product_history", values[0]), done)
+
+    def show_stock_as_of(self):
+        answer = simpledialog.askstring("Остаток на дату", "Дата (ГГГГ-ММ-ДД):", parent=self.root)
+        if not answer:
+            return
+
+        try:
+            # Остаток на конец указанного дня
+            moment = datetime.strptime(answer.strip(), "%Y-%m-%d") + timedelta(days=1) - timedelta(microseconds=1)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверный формат даты!")
+            return
+
+        selected = self.tree.selection()
+        if selected:
+            values = self.tree.item(selected[0])['values']
+            self.executor.submit(
+                SERVICE.bind("product_stock_as_of", moment, values[0]),
+                lambda quantity: messagebox.showinfo(
+                    "Остаток на дату", f"{values[1]} на {moment.strftime('%d.%m.%Y')}: {quantity}"))
+            return
+
+        def done(rows):
+            report_path = write_stock_report(rows, moment)
+            messagebox.showinfo("Успех", f"Остатки сохранены в файл: {report_path}")
+
+        self.executor.submit(SERVICE.bind("fetch_stock_report", moment), done)
+
+    def generate_report(self):
+        if self.current_role != "manager":
+            messagebox.showerror("Ошибка", "Только менеджер может формировать отчеты!")
+            return
+
+        def failed(error):
+            if isinstance(error, ImportError):
+                messagebox.showerror("Ошибка", "Для отчета необходим пакет numpy!")
+            else:
+                messagebox.showerror("Ошибка", str(error))
+
+        def done(analysis):
+            now = datetime.now()
+            report_path = f"warehouse_report_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+            write_inventory_report(analysis, report_path, now)
+            messagebox.showinfo("Успех", f"Отчет сохранен в файл: {report_path}")
+
+        self.executor.submit(SERVICE.bind("fetch_inventory_analysis"), done, failed, key="report")
+
+    def check_snapshot(self):
+        self.executor.submit(
+            SERVICE.bind("ensure_daily_snapshot"),
+            on_error=lambda e: print(f"Ошибка при создании снимка остатков: {str(e)}"),
+            key="snapshot")
+        self.root.after(SNAPSHOT_CHECK_INTERVAL, self.check_snapshot)
+
+    def update_journal_label(self, remaining):
+        self.journal_label.configure(text=f"Ожидают записи в базу: {remaining}" if remaining else "")
+
+    def journal_applied(self, batch, results, remaining):
+        # Вызывается после переноса пачки журнала; до входа в программу таблицы еще нет,
+        # но об отклоненных операциях сообщается сразу
+        self.update_search_index([(result["result"], *record["args"][:2]) for record, result in zip(batch, results)
+                                  if record["operation"] == "insert_product" and "result" in result], [])
+        if hasattr(self, "tree"):
+            self.update_journal_label(remaining)
             self.refresh_data()
-            self.clear_fields()
+        rejected = [str(SERVICE.restore_error(result["error"])) for result in results if "error" in result]
+        if rejected:
+            messagebox.showerror("Операции отклонены", "\n\n".join(rejected))
+
+    def on_db_error(self, error):
+        if isinstance(error, StockConflict):
+            self.refresh_data()
+            messagebox.showerror("Конфликт", str(error))
+        else:
+            messagebox.showerror("Ошибка", str(error))
 
     def on_select(self, event):
         selected = self.tree.selection()
@@ -272,16 +516,270 @@ class WarehouseApp:
         self.quantity.delete(0, tk.END)
         self.price.delete(0, tk.END)
 
+    def start_search_index(self):
+        # Вызывается после показа строк таблицы: чтение всех названий не задерживает первую страницу
+        if self.search_index is None and self.index_backlog is None:
+            self.build_search_index()
+
+    def build_search_index(self):
+        # Названия читаются и индекс строится в отдельном потоке со своим соединением: рабочий поток базы
+        # тем временем загружает страницы. Изменения, пришедшие во время построения, применяются к готовому индексу
+        self.index_backlog = []
+        backend = self.executor.database
+
+        def run():
+            try:
+                rows = SERVICE.bind("fetch_search_terms")(backend.connect())
+            except Exception as e:
+                print(f"Ошибка при построении индекса поиска: {str(e)}")
+                self.executor.call_soon(self.search_index_failed)
+                return
+            finally:
+                backend.discard()
+            index = TrigramIndex()
+            for row_id, product_name, supplier_name in rows:
+                index.add(row_id, product_name, supplier_name)
+            self.executor.call_soon(self.search_index_built, index)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def search_index_failed(self):
+        # Построение повторится после следующей загрузки строк
+        if self.search_index is None:
+            self.index_backlog = None
+
+    def search_index_built(self, index):
+        backlog, self.index_backlog = self.index_backlog, None
+        self.search_index = index
+        for rows, deleted in backlog:
+            self.update_search_index(rows, deleted)
+        if hasattr(self, "filter_var") and self.filter_var.get().strip():
+            self.apply_filter()
+
+    def update_search_index(self, rows, deleted):
+        # rows - строки, начинающиеся с (id, товар, поставщик); deleted - id удаленных товаров
+        if self.index_backlog is not None:
+            self.index_backlog.append((rows, deleted))
+        if self.search_index is None:
+            return
+        for row_id in deleted:
+            self.search_index.remove(row_id)
+        for row in rows:
+            self.search_index.add(row[0], row[1], row[2])
+
+    def on_filter_change(self, *args):
+        # Поиск только после паузы в наборе
+        if self.filter_timer is not None:
+            self.root.after_cancel(self.filter_timer)
+        self.filter_timer = self.root.after(FILTER_DELAY, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_timer = None
+        text = self.filter_var.get().strip()
+        if not text:
+            self.filter_rows = None
+            self.found_label.configure(text="")
+            self.refresh_data()
+            return
+        if self.search_index is None:
+            # Фильтр применится, когда индекс будет построен
+            self.found_label.configure(text="Индекс поиска строится...")
+            return
+
+        ids = self.search_index.search(text, FILTER_LIMIT)
+
+        def done(rows):
+            # Ответ на уже измененный фильтр не показывается
+            if self.filter_var.get().strip() != text:
+                return
+            self.filter_rows = rows
+            self.offset = 0
+            suffix = "+" if len(ids) >= FILTER_LIMIT else ""
+            self.found_label.configure(text=f"Найдено: {len(rows)}{suffix}")
+            self.show_filtered()
+
+        self.executor.submit(SERVICE.bind("fetch_products_by_ids", ids), done, key="refresh")
+
+    def show_filtered(self):
+        if VIRTUAL_TREE:
+            self.show_window()
+            return
+        self.tree.delete(*self.tree.get_children())
+        for row in self.filter_rows:
+            self.tree.insert("", "end", iid=str(row[0]), values=row)
+
+    def reload_data(self):
+        self.build_search_index()
+        self.refresh_data()
+
     def refresh_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        if self.filter_rows is not None:
+            self.apply_filter()
+            return
+        if VIRTUAL_TREE:
+            self.pager.reset()
+            self.show_window()
+            return
+
+        def done(rows):
+            self.tree.delete(*self.tree.get_children())
+            for row in rows:
+                self.tree.insert("", "end", iid=str(row[0]), values=row)
+            self.start_search_index()
+
+        # Повторные обновления подряд склеиваются в один запрос
+        self.executor.submit(SERVICE.bind("fetch_products"), done, key="refresh")
+
+    def apply_changes(self, rows, deleted):
+        self.update_search_index(rows, deleted)
+        if self.filter_rows is not None:
+            # Найденные строки обновляются на месте; новые товары попадут в результат при следующем поиске
+            changed = {row[0]: row for row in rows}
+            removed = set(deleted)
+            self.filter_rows = [changed.get(row[0], row) for row in self.filter_rows if row[0] not in removed]
+            self.show_filtered()
+            return
+        if not VIRTUAL_TREE:
+            patch_tree(self.tree, rows, deleted, key=lambda values: (str(values[7]), int(values[0])),
+                       descending=True)
+            return
+        # Новые, переместившиеся и удаленные товары меняют границы страниц - кэш сбрасывается,
+        # загружается только видимое окно
+        if deleted or not self.pager.patch(rows):
+            self.refresh_data()
+            return
+        for row in rows:
+            if self.tree.exists(str(row[0])):
+                self.tree.item(str(row[0]), values=row)
+
+    def on_tree_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible_rows = max(1, (event.height - row_height) // row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.show_window()
+
+    def on_scroll(self, action, value, unit=None):
+        if action == "moveto":
+            total = len(self.filter_rows) if self.filter_rows is not None else self.pager.total
+            self.offset = int(float(value) * (total or 0))
+            self.show_window()
+        else:
+            self.scroll_rows(int(value), unit)
+
+    def scroll_rows(self, step, unit):
+        self.offset += step * (self.visible_rows if unit == "pages" else 3)
+        self.show_window()
+
+    def request_pages(self, number, key, count=2):
+        generation = self.pager.generation
+        known = number in self.pager.bounds
+        start = self.pager.bounds.get(number)
+        with_total = self.pager.total is None
+
+        def done(result):
+            # Ответ на запрос до сброса кэша уже неактуален
+            if generation != self.pager.generation:
+                return
+            self.pager.store(*result)
+            if key == "window":
+                self.show_window()
+
+        # Новый запрос окна при быстрой прокрутке вытесняет еще не выполненный предыдущий
+        self.executor.submit(
+            SERVICE.bind("fetch_pages", self.pager.page_size, number, count, start, known, with_total), done, key=key)
+
+    def show_window(self):
+        if self.filter_rows is not None:
+            total = len(self.filter_rows)
+            self.offset = max(0, min(self.offset, total - self.visible_rows))
+            self.render_window(self.filter_rows[self.offset:self.offset + self.visible_rows], total)
+            return
+
+        # Прокрутка вверх, пока число строк еще не известно, не уводит окно выше первой строки
+        self.offset = max(0, self.offset)
+        if self.pager.total is None:
+            self.request_pages(self.offset // self.pager.page_size, "window")
+            return
 
-        self.cursor.execute("SELECT * FROM warehouse_data ORDER BY last_operation_date DESC")
-        for row in self.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+        total = self.pager.total
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        rows, missing = self.pager.cached_rows(self.offset, self.visible_rows)
+        if rows is None:
+            # Пока страница загружается, на экране остаются прежние строки
+            self.request_pages(missing, "window")
+            return
 
+        self.render_window(rows, total)
+
+        # Предзагрузка соседних страниц в фоне; у каждого направления свой ключ, чтобы запрос страницы
+        # позади не вытеснял запрос страницы впереди
+        for key, row in (("prefetch_next", self.offset + self.visible_rows + PREFETCH_ROWS),
+                         ("prefetch_previous", self.offset - PREFETCH_ROWS)):
+            number = row // self.pager.page_size
+            if 0 <= row < total and not self.pager.is_cached(number):
+                self.request_pages(number, key, count=1)
+
+    def render_window(self, rows, total):
+        selected = set(self.tree.selection())
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert("", "end", iid=str(row[0]), values=row)
+
+        still_visible = [iid for iid in selected if self.tree.exists(iid)]
+        if still_visible:
+            self.tree.selection_set(still_visible)
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.start_search_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Система управления складом")
+    parser.add_argument("--import", dest="import_path", metavar="CSV",
+                        help="импортировать поставку из CSV без запуска интерфейса")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE,
+                        help="количество строк в одной пачке импорта")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="создать снимок остатков на начало текущих суток и выйти")
+    parser.add_argument("--report", action="store_true",
+                        help="сформировать отчет по оценке запасов и ABC-анализу и выйти")
+    args = parser.parse_args()
+
+    if args.report:
+        db = DATABASE.connect()
+        print(f"Отчет сохранен в файл: {generate_inventory_report(db)}")
+        db.close()
+        return
+
+    if args.snapshot:
+        db = DATABASE.connect()
+        create_table(db)
+        snapshot_id = ensure_daily_snapshot(db)
+        print(f"Создан снимок остатков №{snapshot_id}" if snapshot_id else "Снимок остатков актуален")
+        db.close()
+        return
+
+    if args.import_path:
+        db = DATABASE.connect()
+        create_table(db)
+
+        def progress(imported, fraction):
+            print(f"\rИмпортировано строк: {imported} ({fraction:.0%})", end="", file=sys.stderr, flush=True)
+
+        result = import_csv(db, args.import_path, chunk_size=args.chunk_size, progress=progress)
+        print(file=sys.stderr)
+        print(format_import_summary(*result))
+        db.close()
+        return
 
-if __name__ == "__main__":
     root = tk.Tk()
     app = WarehouseApp(root)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,757 @@
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime
+from migrations import run_migrations, add_column, add_index, index_exists
+from db import Database, prepared, is_integrity_error
+from service import Service
+from journal import APPLIED_OPERATIONS, replay_operations
+from changes import add_change_tracking, fetch_changed_rows, prune_tombstones
+
+# Строк в одной странице постраничной выборки товаров
+PAGE_SIZE = 100
+
+# Массовый импорт поставок: строк в одной пачке executemany и одном коммите
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 20
+
+# Журнал движения товара: записей в окне истории
+HISTORY_LIMIT = 500
+
+# ABC-анализ: границы накопленной доли стоимости для классов A и B
+ABC_THRESHOLDS = (0.8, 0.95)
+REPORT_TOP_ITEMS = 20
+
+COLUMNS = """
+    id, product_name, supplier_name, quantity, price,
+    last_delivery, last_operation, last_operation_date, status, version
+"""
+
+
+class StockConflict(Exception):
+    # Операция не применилась: товар изменен или удален с другого терминала.
+    # edited - конфликт правки или удаления карточки товара, а не нехватка товара
+    def __init__(self, quantity, edited=False):
+        if quantity is None:
+            message = "Товар удален другим пользователем!"
+        elif edited:
+            message = ("Название, поставщик или цена товара изменены другим пользователем. "
+                       "Данные обновлены, повторите операцию.")
+        else:
+            message = ("Товар был изменен другим пользователем или на складе недостаточно "
+                       f"товара (остаток: {quantity}). Данные обновлены, повторите операцию.")
+        super().__init__(message)
+        self.quantity = quantity
+        self.edited = edited
+
+
+DATABASE = Database("warehouse_db")
+
+
+def add_unique_product_key(cursor):
+    # Уникальный ключ товара у поставщика нужен для upsert при импорте
+    try:
+        add_index(cursor, "warehouse_data", "uq_product_supplier", "product_name, supplier_name", unique=True)
+    except Exception as e:
+        if not is_integrity_error(e):
+            raise
+        print(f"Не удалось создать уникальный ключ товара, импорт недоступен до объединения дубликатов: {str(e)}")
+
+
+def require_unique_product_key(db):
+    # Движения импорта привязываются к товару по названию и поставщику: без уникального ключа строка файла
+    # добавила бы новый товар и записала движение для каждого одноименного товара. Если дубликаты уже
+    # объединены, ключ, не созданный миграцией, создается здесь
+    cursor = db.cursor()
+    try:
+        if index_exists(cursor, "warehouse_data", "uq_product_supplier"):
+            return
+        cursor.execute("""
+            SELECT product_name, supplier_name, COUNT(*) FROM warehouse_data
+            GROUP BY product_name, supplier_name HAVING COUNT(*) > 1 LIMIT %s
+        """, (IMPORT_MAX_ERRORS,))
+        duplicates = cursor.fetchall()
+        if not duplicates:
+            add_unique_product_key(cursor)
+            db.commit()
+            return
+    finally:
+        cursor.close()
+    raise ValueError("Импорт недоступен: в базе есть одинаковые товары одного поставщика, объедините их:\n" +
+                     "\n".join(f"{product} ({supplier}): {count} шт." for product, supplier, count in duplicates))
+
+
+def create_ledger(cursor):
+    # Журнал движения товара (только добавление записей) и снимки остатков
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            delta INT NOT NULL,
+            operation VARCHAR(20),
+            quantity_after INT,
+            created_at DATETIME NOT NULL,
+            KEY idx_movements_product (product_id, id),
+            KEY idx_movements_created (created_at)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            taken_at DATETIME NOT NULL,
+            last_movement_id BIGINT NOT NULL,
+            KEY idx_snapshots_taken (taken_at)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_snapshot_balances (
+            snapshot_id INT NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL,
+            PRIMARY KEY (snapshot_id, product_id)
+        )
+    """)
+
+    # Товары, заведенные до появления журнала, получают запись о начальном остатке
+    cursor.execute("SELECT COUNT(*) FROM (SELECT id FROM stock_movements LIMIT 1) t")
+    if not cursor.fetchone()[0]:
+        cursor.execute("""
+            INSERT INTO stock_movements (product_id, delta, operation, quantity_after, created_at)
+            SELECT id, quantity, 'Начальный остаток', quantity, COALESCE(last_operation_date, NOW())
+            FROM warehouse_data
+        """)
+
+
+MIGRATIONS = [
+    (1, "Таблица товаров", ["""
+        CREATE TABLE IF NOT EXISTS warehouse_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_name VARCHAR(100),
+            supplier_name VARCHAR(100),
+            quantity INT,
+            price DECIMAL(10, 2),
+            last_delivery DATE,
+            last_operation VARCHAR(20),
+            last_operation_date DATETIME,
+            status VARCHAR(20)
+        )
+    """]),
+    # Версия карточки товара (название, поставщик, цена): поступление и расход ее не меняют
+    (2, "Версия строки для оптимистической блокировки",
+     lambda cursor: add_column(cursor, "warehouse_data", "version", "INT NOT NULL DEFAULT 0")),
+    (3, "Уникальный ключ товара у поставщика", add_unique_product_key),
+    (4, "Журнал движения товара и снимки остатков", create_ledger),
+    (5, "Индекс по дате операции для постраничной выборки",
+     lambda cursor: add_index(cursor, "warehouse_data", "idx_last_operation", "last_operation_date, id")),
+    (6, "Ключи операций из журналов терминалов", [APPLIED_OPERATIONS]),
+    (7, "Время изменения и удаленные товары для синхронизации терминалов",
+     lambda cursor: add_change_tracking(cursor, "warehouse_data")),
+]
+
+
+def create_table(db):
+    run_migrations(db, MIGRATIONS)
+    prune_tombstones(db)
+
+
+def record_movement(db, product_id, delta, operation, created_at):
+    # Вызывается в той же транзакции, что и изменение остатка
+    query = """
+        INSERT INTO stock_movements (product_id, delta, operation, quantity_after, created_at)
+        SELECT id, %s, %s, quantity, %s FROM warehouse_data WHERE id = %s
+    """
+    prepared(db, query).execute(query, (delta, operation, created_at, product_id))
+
+
+def take_snapshot(db, cutoff):
+    # Снимок строится из предыдущего снимка и хвоста журнала, а не из всей истории
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, last_movement_id FROM stock_snapshots
+            WHERE taken_at <= %s ORDER BY taken_at DESC, id DESC LIMIT 1
+        """, (cutoff,))
+        previous = cursor.fetchone()
+        previous_id, previous_movement = previous if previous else (None, 0)
+
+        cursor.execute("""
+            SELECT id FROM stock_movements
+            WHERE created_at < %s ORDER BY created_at DESC, id DESC LIMIT 1
+        """, (cutoff,))
+        row = cursor.fetchone()
+        last_movement = row[0] if row else 0
+        if previous and last_movement <= previous_movement:
+            return None
+
+        cursor.execute("INSERT INTO stock_snapshots (taken_at, last_movement_id) VALUES (%s, %s)",
+                       (cutoff, last_movement))
+        snapshot_id = cursor.lastrowid
+        cursor.execute("""
+            INSERT INTO stock_snapshot_balances (snapshot_id, product_id, quantity)
+            SELECT %s, product_id, SUM(quantity) FROM (
+                SELECT product_id, quantity FROM stock_snapshot_balances WHERE snapshot_id = %s
+                UNION ALL
+                SELECT product_id, delta FROM stock_movements WHERE id > %s AND id <= %s
+            ) t
+            GROUP BY product_id
+        """, (snapshot_id, previous_id, previous_movement, last_movement))
+        db.commit()
+        return snapshot_id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def ensure_daily_snapshot(db):
+    cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cursor = db.cursor()
+    cursor.execute("SELECT MAX(taken_at) FROM stock_snapshots")
+    last_taken = cursor.fetchone()[0]
+    cursor.close()
+    if last_taken is None or last_taken < cutoff:
+        return take_snapshot(db, cutoff)
+    return None
+
+
+def stock_as_of(cursor, moment, product_id=None):
+    # Остаток = ближайший снимок не позже даты + движения после него до этой даты
+    cursor.execute("""
+        SELECT id, last_movement_id FROM stock_snapshots
+        WHERE taken_at <= %s ORDER BY taken_at DESC, id DESC LIMIT 1
+    """, (moment,))
+    snapshot = cursor.fetchone()
+    snapshot_id, last_movement = snapshot if snapshot else (None, 0)
+    # Движения после даты, вошедшие в следующий снимок, не читаются: для прошлой даты хвост журнала
+    # ограничен одним промежутком между снимками, а не всей историей до сегодняшнего дня
+    cursor.execute("""
+        SELECT last_movement_id FROM stock_snapshots
+        WHERE taken_at > %s ORDER BY taken_at, id LIMIT 1
+    """, (moment,))
+    following = cursor.fetchone()
+    tail_filter = "" if following is None else "AND id <= %s"
+    tail_params = () if following is None else (following[0],)
+
+    product_filter = "" if product_id is None else "AND product_id = %s"
+    product_params = () if product_id is None else (product_id,)
+    cursor.execute(f"""
+        SELECT product_id, SUM(quantity) FROM (
+            SELECT product_id, quantity FROM stock_snapshot_balances
+            WHERE snapshot_id = %s {product_filter}
+            UNION ALL
+            SELECT product_id, delta FROM stock_movements
+            WHERE id > %s {tail_filter} AND created_at <= %s {product_filter}
+        ) t
+        GROUP BY product_id
+    """, (snapshot_id,) + product_params + (last_movement,) + tail_params + (moment,) + product_params)
+    balances = {row[0]: int(row[1]) for row in cursor.fetchall()}
+    if product_id is not None:
+        return balances.get(product_id, 0)
+    return balances
+
+
+def movement_history(cursor, product_id, limit=HISTORY_LIMIT):
+    cursor.execute("""
+        SELECT created_at, operation, delta, quantity_after FROM stock_movements
+        WHERE product_id = %s ORDER BY id DESC LIMIT %s
+    """, (product_id, limit))
+    return cursor.fetchall()
+
+
+def parse_import_row(row):
+    product_name = (row.get("product_name") or "").strip()
+    supplier_name = (row.get("supplier_name") or "").strip()
+    if not product_name or not supplier_name:
+        raise ValueError("не указан товар или поставщик")
+
+    try:
+        quantity = int(row.get("quantity") or "")
+        price = float((row.get("price") or "").replace(",", "."))
+    except ValueError:
+        raise ValueError("неверный формат количества или цены")
+    if quantity < 0 or price < 0:
+        raise ValueError("отрицательное количество или цена")
+
+    last_delivery = (row.get("last_delivery") or "").strip()
+    last_delivery = datetime.strptime(last_delivery, "%Y-%m-%d").date() if last_delivery else datetime.now().date()
+
+    return (
+        product_name,
+        supplier_name,
+        quantity,
+        price,
+        last_delivery,
+        "Поступление",
+        datetime.now(),
+        "В наличии" if quantity > 0 else "Нет в наличии"
+    )
+
+
+def import_csv_text(db, text, chunk_size=IMPORT_CHUNK_SIZE):
+    # Импорт файла, присланного терминалом через сервер: содержимое сохраняется во временный файл
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", encoding="utf-8", newline="", delete=False) as f:
+        f.write(text)
+    try:
+        return import_csv(db, f.name, chunk_size)
+    finally:
+        os.remove(f.name)
+
+
+def import_csv(db, path, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    # Потоковый импорт: файл читается построчно, в память попадает только текущая пачка
+    require_unique_product_key(db)
+    query = """
+        INSERT INTO warehouse_data (
+            product_name, supplier_name, quantity, price,
+            last_delivery, last_operation, last_operation_date, status
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            status = CASE WHEN quantity + VALUES(quantity) > 0 THEN 'В наличии' ELSE 'Нет в наличии' END,
+            quantity = quantity + VALUES(quantity),
+            price = VALUES(price),
+            last_delivery = VALUES(last_delivery),
+            last_operation = VALUES(last_operation),
+            last_operation_date = VALUES(last_operation_date),
+            version = version + 1
+    """
+    movement_query = """
+        INSERT INTO stock_movements (product_id, delta, operation, quantity_after, created_at)
+        SELECT id, %s, %s, quantity, %s FROM warehouse_data WHERE product_name = %s AND supplier_name = %s
+    """
+    cursor = db.cursor()
+    total_size = os.path.getsize(path) or 1
+    imported = 0
+    rejected = 0
+    errors = []
+    chunk = []
+    started = time.perf_counter()
+
+    def flush():
+        cursor.executemany(query, chunk)
+        cursor.executemany(movement_query, [(row[2], row[5], row[6], row[0], row[1]) for row in chunk])
+        db.commit()
+        chunk.clear()
+
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+
+            for line_number, row in enumerate(csv.DictReader(f, dialect=dialect), start=2):
+                try:
+                    chunk.append(parse_import_row(row))
+                except (ValueError, TypeError) as e:
+                    rejected += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append(f"Строка {line_number}: {str(e)}")
+                    continue
+
+                if len(chunk) >= chunk_size:
+                    imported += len(chunk)
+                    flush()
+                    if progress:
+                        progress(imported, min(1.0, f.buffer.tell() / total_size))
+
+            if chunk:
+                imported += len(chunk)
+                flush()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - started
+    if progress:
+        progress(imported, 1.0)
+    return imported, rejected, errors, elapsed
+
+
+def format_import_summary(imported, rejected, errors, elapsed):
+    rate = imported / elapsed if elapsed > 0 else imported
+    lines = [
+        f"Импортировано строк: {imported}",
+        f"Отклонено строк: {rejected}",
+        f"Время: {elapsed:.1f} с ({rate:.0f} строк/с)"
+    ]
+    lines.extend(errors)
+    return "\n".join(lines)
+
+
+def fetch_inventory_columns(cursor):
+    # Одна выборка всех нужных столбцов, дальше вычисления идут над массивами
+    cursor.execute("""
+        SELECT COALESCE(product_name, ''), COALESCE(supplier_name, ''), COALESCE(status, ''),
+               COALESCE(quantity, 0), COALESCE(price, 0)
+        FROM warehouse_data
+    """)
+    rows = cursor.fetchall()
+    if not rows:
+        return [], [], [], [], []
+    return [list(column) for column in zip(*rows)]
+
+
+def inventory_analysis(products, suppliers, statuses, quantities, prices, thresholds=ABC_THRESHOLDS):
+    import numpy as np
+
+    products = np.array(products, dtype=str)
+    quantities = np.array(quantities, dtype=np.int64)
+    values = quantities * np.array(prices, dtype=np.float64)
+    total_value = float(values.sum())
+
+    def group(labels):
+        names, index = np.unique(np.array(labels, dtype=str), return_inverse=True)
+        group_values = np.bincount(index, weights=values, minlength=len(names))
+        group_quantities = np.bincount(index, weights=quantities, minlength=len(names))
+        group_counts = np.bincount(index, minlength=len(names))
+        order = np.argsort(-group_values, kind="stable")
+        return [(str(names[i]), int(group_counts[i]), int(group_quantities[i]), float(group_values[i]))
+                for i in order]
+
+    # Класс товара определяется накопленной долей стоимости всех более дорогих позиций
+    order = np.argsort(-values, kind="stable")
+    sorted_values = values[order]
+    if total_value > 0:
+        share_before = (np.cumsum(sorted_values) - sorted_values) / total_value
+    else:
+        share_before = np.ones(len(sorted_values))
+    classes = np.searchsorted(np.array(thresholds), share_before, side="right")
+    class_counts = np.bincount(classes, minlength=3)
+    class_values = np.bincount(classes, weights=sorted_values, minlength=3)
+
+    top = order[:REPORT_TOP_ITEMS]
+    return {
+        "items": len(values),
+        "total_quantity": int(quantities.sum()),
+        "total_value": total_value,
+        "suppliers": group(suppliers),
+        "statuses": group(statuses),
+        "abc": [(name, int(class_counts[i]), float(class_values[i])) for i, name in enumerate("ABC")],
+        "top_items": [(str(products[i]), float(values[i])) for i in top]
+    }
+
+
+def write_inventory_report(analysis, report_path, now):
+    total_value = analysis["total_value"] or 1
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f"Оценка запасов на {now.strftime('%d.%m.%Y %H:%M')}\n")
+        f.write("-" * 40 + "\n")
+        f.write(f"Позиций: {analysis['items']}\n")
+        f.write(f"Общее количество: {analysis['total_quantity']}\n")
+        f.write(f"Общая стоимость: {analysis['total_value']:.2f} руб.\n\n")
+
+        f.write("Стоимость по поставщикам\n")
+        f.write("-" * 40 + "\n")
+        for name, count, quantity, value in analysis["suppliers"]:
+            f.write(f"{name or '(не указан)'}: {count} поз., {quantity} шт., {value:.2f} руб. "
+                    f"({value / total_value:.1%})\n")
+
+        f.write("\nПо статусам\n")
+        f.write("-" * 40 + "\n")
+        for name, count, quantity, value in analysis["statuses"]:
+            f.write(f"{name or '(не указан)'}: {count} поз., {quantity} шт., {value:.2f} руб.\n")
+
+        f.write("\nABC-анализ\n")
+        f.write("-" * 40 + "\n")
+        for name, count, value in analysis["abc"]:
+            f.write(f"Класс {name}: {count} поз., {value:.2f} руб. ({value / total_value:.1%})\n")
+
+        f.write(f"\nСамые дорогие позиции (топ-{REPORT_TOP_ITEMS})\n")
+        f.write("-" * 40 + "\n")
+        for name, value in analysis["top_items"]:
+            f.write(f"{name}: {value:.2f} руб.\n")
+
+        f.write(f"\nДата формирования: {now.strftime('%d.%m.%Y %H:%M:%S')}\n")
+
+
+def fetch_inventory_analysis(db):
+    cursor = db.cursor()
+    try:
+        return inventory_analysis(*fetch_inventory_columns(cursor))
+    finally:
+        cursor.close()
+
+
+def generate_inventory_report(db):
+    now = datetime.now()
+    analysis = fetch_inventory_analysis(db)
+    report_path = f"warehouse_report_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+    write_inventory_report(analysis, report_path, now)
+    return report_path
+
+
+def raise_conflict(db, item_id, edited=False):
+    db.rollback()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT quantity FROM warehouse_data WHERE id = %s", (item_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    raise StockConflict(row[0] if row else None, edited)
+
+
+def insert_product(db, product_name, supplier_name, quantity, price):
+    query = """
+        INSERT INTO warehouse_data (
+            product_name, supplier_name, quantity, price,
+            last_delivery, last_operation, last_operation_date, status
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    values = (
+        product_name,
+        supplier_name,
+        quantity,
+        price,
+        datetime.now().date(),
+        "Поступление",
+        datetime.now(),
+        "В наличии"
+    )
+
+    cursor = prepared(db, query)
+    cursor.execute(query, values)
+    product_id = cursor.lastrowid
+    record_movement(db, product_id, quantity, "Поступление", values[6])
+    db.commit()
+    return product_id
+
+
+def apply_movement(db, item_id, delta, operation):
+    # Изменение применяется на сервере как приращение, проверка остатка - в том же UPDATE.
+    # Статус считается от старого остатка плюс приращение: MySQL присваивает столбцы по порядку,
+    # SQLite - по значениям строки до изменения, так результат одинаков.
+    # version не меняется, чтобы правка и удаление товара не конфликтовали с обычным движением товара
+    query = """
+        UPDATE warehouse_data SET
+            status = CASE WHEN quantity + %s > 0 THEN 'В наличии' ELSE 'Нет в наличии' END,
+            quantity = quantity + %s,
+            last_operation = %s,
+            last_operation_date = %s
+        WHERE id = %s AND quantity + %s >= 0
+    """
+    now = datetime.now()
+    values = (
+        delta,
+        delta,
+        operation,
+        now,
+        item_id,
+        delta
+    )
+
+    cursor = prepared(db, query)
+    cursor.execute(query, values)
+    if cursor.rowcount == 0:
+        raise_conflict(db, item_id)
+    record_movement(db, item_id, delta, operation, now)
+    db.commit()
+
+
+def update_product(db, item_id, version, product_name, supplier_name, price):
+    query = """
+        UPDATE warehouse_data SET
+            product_name = %s,
+            supplier_name = %s,
+            price = %s,
+            version = version + 1
+        WHERE id = %s AND version = %s
+    """
+    cursor = prepared(db, query)
+    cursor.execute(query, (product_name, supplier_name, price, item_id, version))
+    if cursor.rowcount == 0:
+        raise_conflict(db, item_id, edited=True)
+    db.commit()
+
+
+def delete_product(db, item_id, version):
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO stock_movements (product_id, delta, operation, quantity_after, created_at)
+            SELECT id, -quantity, 'Удаление', 0, %s FROM warehouse_data WHERE id = %s AND version = %s
+        """, (datetime.now(), item_id, version))
+        cursor.execute("DELETE FROM warehouse_data WHERE id = %s AND version = %s", (item_id, version))
+        if cursor.rowcount == 0:
+            raise_conflict(db, item_id, edited=True)
+        db.commit()
+    finally:
+        cursor.close()
+
+
+def fetch_products(db):
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT {COLUMNS} FROM warehouse_data ORDER BY last_operation_date DESC, id DESC")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def fetch_stock_report(db, moment):
+    # Строки (id, товар, поставщик, остаток) на указанный момент, включая удаленные с тех пор товары
+    cursor = db.cursor()
+    try:
+        balances = stock_as_of(cursor, moment)
+        cursor.execute("SELECT id, product_name, supplier_name FROM warehouse_data")
+        names = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+    return [(product_id,) + names.get(product_id, ("(удален)", "")) + (quantity,)
+            for product_id, quantity in sorted(balances.items())]
+
+
+def write_stock_report(rows, moment):
+    report_path = f"stock_{moment.strftime('%Y%m%d')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f"Остатки на {moment.strftime('%d.%m.%Y')}\n")
+        f.write("-" * 40 + "\n")
+        for product_id, product_name, supplier_name, quantity in rows:
+            f.write(f"{product_id}\t{product_name}\t{supplier_name}\t{quantity}\n")
+    return report_path
+
+
+def with_cursor(fn, *args):
+    # Обертка для функций чтения, принимающих курсор
+    def job(db):
+        cursor = db.cursor()
+        try:
+            return fn(cursor, *args)
+        finally:
+            cursor.close()
+    return job
+
+
+def product_history(db, product_id):
+    return with_cursor(movement_history, product_id)(db)
+
+
+def product_stock_as_of(db, moment, product_id):
+    return with_cursor(stock_as_of, moment, product_id)(db)
+
+
+def fetch_pages(db, page_size, number, count, start, known, with_total):
+    # Страницы товаров по ключу (last_operation_date, id) начиная со страницы number;
+    # start - ключ последней строки предыдущей страницы, если он известен (known)
+    if number < 0:
+        raise ValueError(f"Неверный номер страницы: {number}")
+    cursor = db.cursor()
+    try:
+        total = None
+        if with_total:
+            cursor.execute("SELECT COUNT(*) FROM warehouse_data")
+            total = cursor.fetchone()[0]
+        if not known:
+            start = seek_page(cursor, page_size, number)
+
+        pages = []
+        for current in range(number, number + count):
+            # Пустой ключ у ненулевой страницы означает, что она за концом таблицы
+            rows = fetch_page_after(db, page_size, start) if start is not None or current == 0 else []
+            pages.append((current, start, rows))
+            if len(rows) < page_size:
+                break
+            start = (rows[-1][7], rows[-1][0])
+        return total, pages
+    finally:
+        cursor.close()
+
+
+def seek_page(cursor, page_size, number):
+    # Переход далеко вперед: ищем границу страницы только по индексу, без чтения строк
+    if number < 0:
+        raise ValueError(f"Неверный номер страницы: {number}")
+    if number == 0:
+        return None
+    cursor.execute("""
+        SELECT last_operation_date, id FROM warehouse_data
+        ORDER BY last_operation_date DESC, id DESC
+        LIMIT 1 OFFSET %s
+    """, (number * page_size - 1,))
+    row = cursor.fetchone()
+    return tuple(row) if row else None
+
+
+def fetch_page_after(db, page_size, key):
+    if key is None:
+        query = f"""
+            SELECT {COLUMNS} FROM warehouse_data
+            ORDER BY last_operation_date DESC, id DESC
+            LIMIT %s
+        """
+        values = (page_size,)
+    else:
+        query = f"""
+            SELECT {COLUMNS} FROM warehouse_data
+            WHERE (last_operation_date, id) < (%s, %s)
+            ORDER BY last_operation_date DESC, id DESC
+            LIMIT %s
+        """
+        values = (key[0], key[1], page_size)
+    cursor = prepared(db, query)
+    cursor.execute(query, values)
+    return cursor.fetchall()
+
+
+def fetch_search_terms(db):
+    # Названия товаров и поставщиков для индекса нечеткого поиска в интерфейсе
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT id, product_name, supplier_name FROM warehouse_data")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def fetch_products_by_ids(db, ids):
+    # Товары, найденные поиском, в порядке ids
+    if not ids:
+        return []
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT {COLUMNS} FROM warehouse_data WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                       tuple(ids))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    position = {row_id: index for index, row_id in enumerate(ids)}
+    rows.sort(key=lambda row: position[row[0]])
+    return rows
+
+
+def fetch_changes(db, since):
+    # Товары, измененные с since, и удаленные товары - для обновления таблицы без полной перезагрузки
+    return fetch_changed_rows(db, "warehouse_data", COLUMNS, since)
+
+
+def replay_journal(db, entries):
+    # Записи журнала терминала: [(ключ, операция, аргументы), ...]
+    return replay_operations(SERVICE, db, entries)
+
+
+# Операции, которые интерфейс вызывает через SERVICE.bind - локально или на сервере
+SERVICE = Service("warehouse", DATABASE, [
+    create_table,
+    ensure_daily_snapshot,
+    insert_product,
+    apply_movement,
+    update_product,
+    delete_product,
+    fetch_products,
+    fetch_pages,
+    fetch_changes,
+    fetch_search_terms,
+    fetch_products_by_ids,
+    product_history,
+    product_stock_as_of,
+    fetch_stock_report,
+    fetch_inventory_analysis,
+    import_csv_text,
+    replay_journal,
+], errors=[StockConflict, ImportError, ModuleNotFoundError], idempotent=[replay_journal])